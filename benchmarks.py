@@ -0,0 +1,2340 @@
+"""
+🏥 HOSPITAL MANAGEMENT SYSTEM - BENCHMARKS
+Run with: python benchmarks.py <benchmark> [options]
+          python benchmarks.py --help
+"""
+
+import argparse
+import collections
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import multiprocessing
+import operator
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import hospital_core as hospital   # the program; hospital.py only launches it
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def print_header(title):
+    print("\n" + "="*60)
+    print(title)
+    print("="*60)
+
+def print_row(label, value):
+    print(f"{label:32} {value}")
+
+@contextlib.contextmanager
+def temp_system(**kwargs):
+    """A SimpleHospitalSystem on a fresh database in a temporary directory (with the sample data unless told otherwise)"""
+    kwargs.setdefault('sample_data', True)
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = hospital.SimpleHospitalSystem(db_path=os.path.join(tmp, "hospital.db"), **kwargs)
+        try:
+            yield system
+        finally:
+            system.close()
+
+FIRST_NAMES = [
+    "Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", "Krishna", "Ishaan", "Rohan",
+    "Ananya", "Diya", "Saanvi", "Aadhya", "Priya", "Meenakshi", "Lakshmi", "Kavya", "Pooja", "Sneha",
+    "Rajesh", "Suresh", "Ramesh", "Mahesh", "Anil", "Sunil", "Vijay", "Ajay", "Sanjay", "Manoj",
+    "Deepa", "Geetha", "Radha", "Sita", "Uma", "Usha", "Asha", "Latha", "Rekha", "Shobha",
+]
+LAST_NAMES = [
+    "Kumar", "Sharma", "Verma", "Reddy", "Rao", "Naidu", "Iyer", "Iyengar", "Nair", "Menon",
+    "Pillai", "Gupta", "Agarwal", "Patel", "Shah", "Mehta", "Joshi", "Kulkarni", "Deshpande", "Singh",
+    "Thupakula", "Chowdary", "Varma", "Raju", "Prasad", "Krishnan", "Subramanian", "Das", "Bose", "Sen",
+]
+CITIES = ["Hyderabad", "Bangalore", "Chennai", "Vijayawada", "Guntur", "Tirupati", "Mumbai", "Pune", "Delhi", "Kochi"]
+
+def patient_name(i):
+    return f"{FIRST_NAMES[i * 7 % len(FIRST_NAMES)]} {LAST_NAMES[i * 13 % len(LAST_NAMES)]}"
+
+def add_patients(system, count, start=0):
+    rows = (
+        (hospital.format_id("P", i + 1), patient_name(i), 20 + i % 60, "MF"[i % 2], f"9{i * 7919 % 10**9:09d}",
+         f"{1 + i % 200} Main Road, {CITIES[i % len(CITIES)]}", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}")
+        for i in range(start, start + count)
+    )
+    system.db.cursor.executemany(
+        "INSERT INTO patients (patient_id, name, age, gender, phone, address, reg_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    system.db.conn.commit()
+
+# ============================================================================
+# SYNTHETIC DATA
+# ============================================================================
+
+SPECIALIZATIONS = [
+    "General Medicine", "General Medicine", "Pediatrics", "Gynecology", "Orthopedics", "Cardiology",
+    "Dermatology", "ENT", "Ophthalmology", "Neurology", "Psychiatry", "Dental",
+]
+MEDICINE_NAMES = [
+    "Paracetamol", "Amoxicillin", "Azithromycin", "Cetirizine", "Metformin", "Amlodipine", "Atorvastatin",
+    "Pantoprazole", "Omeprazole", "Ibuprofen", "Diclofenac", "Losartan", "Telmisartan", "Insulin",
+    "Salbutamol", "Montelukast", "Levothyroxine", "Ciprofloxacin", "Doxycycline", "Ondansetron",
+]
+STRENGTHS = [5, 10, 20, 50, 250, 500]
+DAY_SLOTS = 32                 # 15-minute slots in the default 09:00-17:00 day
+WEEKDAY_LOAD = [1.3, 1.1, 1.0, 1.0, 1.0, 0.6, 0.0]   # Monday first; Sunday closed
+GENERATE_CHUNK = 50_000        # rows per executemany/commit while generating
+# Bulk tables whose triggers are dropped while generating; what they maintain is rebuilt after
+GENERATE_SUSPENDED = ("patients", "appointments", "bills", "bill_items", "payments")
+
+def _flush(cursor, sql, rows):
+    if rows:
+        cursor.executemany(sql, rows)
+        rows.clear()
+
+def generate_dataset(system, patients, seed=42, anchor=None, days=365, visits=2.0, progress=None):
+    """Fill a fresh database with a reproducible, realistically skewed hospital.
+    
+    The same arguments always produce the same rows. Doctors (one per
+    thousand patients) get Zipf-like popularity; weekdays are busier than
+    Saturdays and Sundays are closed; registrations grow towards `anchor`
+    and long-registered patients come back more often. Past appointments
+    are mostly completed and billed (consultation plus medicines, most
+    paid); the two weeks from `anchor` are booked ahead. Heavy triggers
+    are dropped while rows stream in and the search index and counters are
+    rebuilt once at the end. Returns {table: rows}.
+    """
+    rnd = random.Random(seed)
+    anchor = anchor or datetime.date.today()
+    if system.db.conn.execute("SELECT EXISTS(SELECT 1 FROM patients)").fetchone()[0]:
+        raise ValueError("generate_dataset needs a database without patients")
+    first_day = anchor - datetime.timedelta(days=days)
+    last_day = anchor + datetime.timedelta(days=13)
+    conn = system.db.conn
+    cursor = conn.cursor()
+    counts = {}
+    
+    def report(stage, done):
+        if progress:
+            progress(stage, done)
+    
+    saved = cursor.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN "
+        f"({','.join('?' * len(GENERATE_SUSPENDED))})", GENERATE_SUSPENDED
+    ).fetchall()
+    conn.execute("PRAGMA synchronous = OFF")
+    for name, _ in saved:
+        cursor.execute(f"DROP TRIGGER {name}")
+    conn.commit()
+    try:
+        # Doctors, most popular first; the sample doctors (if any) are kept and ranked first
+        doctor_count = max(10, patients // 1000)
+        doctors = [tuple(row) for row in cursor.execute("SELECT doctor_id, fee_paise FROM doctors ORDER BY id").fetchall()]
+        added = []
+        for i in range(len(doctors), doctor_count):
+            added.append((hospital.format_id("DOC", i + 1), f"Dr. {patient_name(rnd.randrange(10**6))}",
+                          rnd.choice(SPECIALIZATIONS), 5000 * rnd.randint(6, 30), f"8{rnd.randrange(10**9):09d}"))
+        cursor.executemany(
+            "INSERT INTO doctors (doctor_id, name, specialization, fee_paise, phone) VALUES (?, ?, ?, ?, ?)", added
+        )
+        doctors += [(doctor_id, fee) for doctor_id, _, _, fee, _ in added]
+        doctor_count = len(doctors)
+        popularity = [1 / (rank + 1) ** 0.7 for rank in range(doctor_count)]
+        total_popularity = sum(popularity)
+        counts['doctors'] = doctor_count
+        
+        # Medicines: a few batches per product, some low, some near expiry
+        medicines = []
+        for name in MEDICINE_NAMES:
+            for strength in rnd.sample(STRENGTHS, 2):
+                price = round(rnd.uniform(100, 4000) * (1 + strength / 250))
+                for batch in range(3):
+                    expiry = anchor + datetime.timedelta(days=rnd.randint(-20, 900))
+                    medicines.append((f"{name} {strength}mg", rnd.choice([5, 40, 200, 500, 1000]), price,
+                                      expiry.isoformat(), f"{name[:3].upper()}{strength}-{batch + 1}"))
+        cursor.executemany(
+            "INSERT INTO medicines (name, quantity, price_paise, expiry, batch_no) VALUES (?, ?, ?, ?, ?)", medicines
+        )
+        prices = [(name, price) for name, _, price, _, _ in medicines[::3]]
+        counts['medicines'] = len(medicines)
+        conn.commit()
+        
+        # Patients, registered over five years with growth towards the anchor
+        span = 5 * 365
+        reg_first = anchor - datetime.timedelta(days=span)
+        rows = []
+        sql = "INSERT INTO patients (patient_id, name, age, gender, phone, address, reg_date) VALUES (?, ?, ?, ?, ?, ?, ?)"
+        for i in range(patients):
+            reg = reg_first + datetime.timedelta(days=int(span * ((i + 1) / patients) ** 0.8))
+            rows.append((hospital.format_id("P", i + 1),
+                         f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}", int(rnd.triangular(0, 90, 35)),
+                         rnd.choice("MMFFO" if i % 97 == 0 else "MF"), f"9{rnd.randrange(10**9):09d}",
+                         f"{rnd.randint(1, 400)} {rnd.choice(['Main Road', 'Gandhi Nagar', 'MG Road', 'Station Road'])}, "
+                         f"{rnd.choice(CITIES)}", reg.isoformat()))
+            if len(rows) >= GENERATE_CHUNK:
+                _flush(cursor, sql, rows)
+                conn.commit()
+                report("patients", i + 1)
+        _flush(cursor, sql, rows)
+        conn.commit()
+        counts['patients'] = patients
+        
+        def registered_by(day):
+            # Inverse of the registration curve above
+            elapsed = min(1.0, max(0.0, (day - reg_first).days / span))
+            return max(1, min(patients, int(patients * elapsed ** 1.25)))
+        
+        # Appointments day by day, doctor by doctor; each gets distinct slots
+        load = [WEEKDAY_LOAD[(first_day + datetime.timedelta(days=d)).weekday()] for d in range(days)]
+        per_load = visits * patients / max(sum(load), 1e-9)
+        appointment_sql = "INSERT INTO appointments (appointment_id, patient_id, doctor_id, date, time, status, duration) VALUES (?, ?, ?, ?, ?, ?, 15)"
+        bill_sql = "INSERT INTO bills (bill_no, patient_id, total_paise, paid_paise, status, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+        item_sql = ("INSERT INTO bill_items (bill_no, kind, description, quantity, unit_paise, amount_paise, appointment_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)")
+        payment_sql = "INSERT INTO payments (bill_no, amount_paise, method, paid_at) VALUES (?, ?, ?, ?)"
+        appointments, bills, items, payments = [], [], [], []
+        appointment_no = bill_no_seq = 0
+        day = first_day
+        while day <= last_day:
+            weekday_load = WEEKDAY_LOAD[day.weekday()]
+            limit = registered_by(day)
+            date = day.isoformat()
+            for rank, (doctor_id, fee) in enumerate(doctors):
+                expected = per_load * weekday_load * popularity[rank] / total_popularity
+                booked = int(expected) + (rnd.random() < expected - int(expected))
+                if not booked:
+                    continue
+                for slot in sorted(rnd.sample(range(DAY_SLOTS), min(DAY_SLOTS, booked))):
+                    appointment_no += 1
+                    appointment_id = hospital.format_id("APT", appointment_no)
+                    # Older patients come back more often
+                    patient_id = hospital.format_id("P", 1 + int(limit * rnd.random() ** 1.5))
+                    time_ = hospital.to_hhmm(9 * 60 + 15 * slot)
+                    if day >= anchor:
+                        status = "Scheduled"
+                    else:
+                        roll = rnd.random()
+                        status = "Completed" if roll < 0.85 else "Cancelled" if roll < 0.95 else "No-show"
+                    appointments.append((appointment_id, patient_id, doctor_id, date, time_, status))
+                    if status != "Completed":
+                        continue
+                    
+                    bill_no_seq += 1
+                    bill_no = hospital.format_id("BILL", bill_no_seq)
+                    created = f"{date} {time_}:00"
+                    lines = [("consultation", "Consultation", 1, fee, appointment_id)]
+                    if rnd.random() < 0.6:
+                        for name, unit in rnd.sample(prices, rnd.randint(1, 3)):
+                            lines.append(("medicine", name, rnd.randint(1, 20), unit, None))
+                    total = 0
+                    for kind, description, quantity, unit, linked in lines:
+                        items.append((bill_no, kind, description, quantity, unit, quantity * unit, linked))
+                        total += quantity * unit
+                    roll = rnd.random()
+                    paid = total if roll < 0.75 else total // 2 if roll < 0.85 else 0
+                    status = "Paid" if paid == total else "Partial" if paid else "Pending"
+                    bills.append((bill_no, patient_id, total, paid, status, created))
+                    if paid:
+                        payments.append((bill_no, paid, rnd.choice(["cash", "card", "upi", "upi"]), created))
+            if len(appointments) >= GENERATE_CHUNK:
+                _flush(cursor, appointment_sql, appointments)
+                _flush(cursor, bill_sql, bills)
+                _flush(cursor, item_sql, items)
+                _flush(cursor, payment_sql, payments)
+                conn.commit()
+                report("appointments", appointment_no)
+            day += datetime.timedelta(days=1)
+        counts['bill_items'] = cursor.execute("SELECT COUNT(*) FROM bill_items").fetchone()[0] + len(items)
+        counts['payments'] = cursor.execute("SELECT COUNT(*) FROM payments").fetchone()[0] + len(payments)
+        _flush(cursor, appointment_sql, appointments)
+        _flush(cursor, bill_sql, bills)
+        _flush(cursor, item_sql, items)
+        _flush(cursor, payment_sql, payments)
+        conn.commit()
+        counts['appointments'] = appointment_no
+        counts['bills'] = bill_no_seq
+    finally:
+        for _, trigger_sql in saved:
+            cursor.execute(trigger_sql)
+        report("indexes", 0)
+        cursor.execute("INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO patients_trigram (patients_trigram) VALUES ('rebuild')")
+        system.db.rebuild_counters()
+        conn.commit()
+        conn.execute("PRAGMA synchronous = NORMAL")
+        system.service.invalidate_cache()
+    return counts
+
+# ============================================================================
+# ID ALLOCATION UNDER CONTENTION
+# ============================================================================
+
+def _id_worker(path, strategy, count, block_size, think, queue):
+    conn = sqlite3.connect(path, timeout=30)
+    allocator = hospital.IdAllocator(types.SimpleNamespace(conn=conn), block_size=block_size)
+    codes, conflicts = [], 0
+    
+    for _ in range(count):
+        try:
+            if strategy == "max-id":
+                # What generate_id used to do: pick the ID, then fill the form
+                max_id = conn.execute("SELECT MAX(id) FROM bench_rows").fetchone()[0] or 0
+                code = f"P{max_id + 1:03d}"
+                time.sleep(think)
+            else:
+                time.sleep(think)
+                code = allocator.next_id('P', 'bench_rows')
+            conn.execute("INSERT INTO bench_rows (code) VALUES (?)", (code,))
+            conn.commit()
+            codes.append(code)
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            conflicts += 1
+    
+    allocator.close()
+    conn.close()
+    queue.put((codes, conflicts))
+
+def bench_ids(args):
+    print_header("ID ALLOCATION UNDER CONTENTION")
+    print_row("Writers:", args.workers)
+    print_row("IDs per writer:", args.count)
+    
+    strategies = [("max-id", 1), ("sequence", 1), ("sequence", args.block_size)]
+    for strategy, block_size in strategies:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ids.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE bench_rows (id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT UNIQUE)")
+            conn.execute("CREATE TABLE id_sequences (name TEXT PRIMARY KEY, next_value INTEGER NOT NULL, width INTEGER)")
+            conn.commit()
+            conn.close()
+            
+            queue = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(target=_id_worker, args=(path, strategy, args.count, block_size, args.think_ms / 1000, queue))
+                for _ in range(args.workers)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            results = [queue.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        
+        codes = [code for worker_codes, _ in results for code in worker_codes]
+        conflicts = sum(c for _, c in results)
+        label = strategy if block_size == 1 else f"{strategy} (block {block_size})"
+        print("-"*60)
+        print_row("Strategy:", label)
+        print_row("IDs issued:", len(codes))
+        print_row("Duplicate-key failures:", conflicts)
+        print_row("Duplicates issued:", len(codes) - len(set(codes)))
+        print_row("Throughput:", f"{len(codes) / elapsed:,.0f} IDs/sec")
+    print("-"*60)
+
+# ============================================================================
+# PATIENT LISTING MEMORY
+# ============================================================================
+
+def percentiles(samples, points=(50, 95, 99)):
+    ordered = sorted(samples)
+    return {p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+
+def _peak_memory(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+def bench_patients(args):
+    print_header("PATIENT LISTING: fetchall() vs streaming")
+    print(f"{'Patients':>10} | {'fetchall peak':>14} | {'stream peak':>12} | {'fetchall':>9} | {'stream':>9}")
+    print("-"*68)
+    
+    with temp_system() as system:
+        total = 0
+        for size in args.sizes:
+            add_patients(system, size - total, start=total)
+            total = size
+            
+            def fetch_all():
+                system.db.cursor.execute("SELECT * FROM patients ORDER BY reg_date DESC")
+                return len(system.db.cursor.fetchall())
+            
+            def stream():
+                return sum(1 for _ in system.iter_patients())
+            
+            rows_a, time_a, peak_a = _peak_memory(fetch_all)
+            rows_b, time_b, peak_b = _peak_memory(stream)
+            assert rows_a == rows_b == size
+            print(f"{size:>10,} | {peak_a / 2**20:>11.1f} MB | {peak_b / 2**20:>9.2f} MB | "
+                  f"{time_a:>8.2f}s | {time_b:>8.2f}s")
+    print("-"*68)
+
+# ============================================================================
+# TYPED ROWS
+# ============================================================================
+
+def _row_shapes():
+    # (label, rows -> that shape, row factory for the cursor or None)
+    import dataclasses
+    
+    @dataclasses.dataclass(slots=True)
+    class SlotsPatient:
+        id: int
+        patient_id: str
+        name: str
+        age: int
+        gender: str
+        phone: str
+        address: str
+        reg_date: str
+    
+    columns = hospital.Patient._fields
+    return [
+        ("tuple (as fetched)", lambda rows: rows, None),
+        ("Patient.from_row", lambda rows: list(map(hospital.Patient.from_row, rows)), None),
+        ("sqlite3.Row", None, sqlite3.Row),
+        ("slots dataclass", lambda rows: [SlotsPatient(*row) for row in rows], None),
+        ("dict", lambda rows: [dict(zip(columns, row)) for row in rows], None),
+    ]
+
+def bench_models(args):
+    print_header("TYPED ROWS: MEMORY AND TIME PER ROW")
+    with temp_system(sample_data=False) as system:
+        add_patients(system, args.rows)
+        conn = system.db.conn
+        print_row("Rows:", f"{args.rows:,} patients, SELECT * (8 columns)")
+        print(f"\n{'shape':20} | {'row object B':>12} | {'fetch + build':>13} | {'vs tuple':>8} | {'attribute read':>14}")
+        print("-"*80)
+        
+        shared = conn.execute("SELECT * FROM patients").fetchall()
+        base = None
+        for label, convert, factory in _row_shapes():
+            # The row objects alone: built over rows already in memory, so the values are shared
+            if factory is None:
+                _, _, peak = _peak_memory(lambda: convert(shared))
+                size = 0 if convert(shared[:1])[0] is shared[0] else peak / len(shared)
+            else:
+                cursor = conn.cursor()
+                cursor.row_factory = factory
+                sample = cursor.execute("SELECT * FROM patients LIMIT 1").fetchone()
+                # The Row object, the tuple it wraps and a list slot
+                size = sys.getsizeof(sample) + sys.getsizeof(tuple(sample)) + 8
+            
+            def fetch():
+                cursor = conn.cursor()
+                cursor.row_factory = factory
+                rows = cursor.execute("SELECT * FROM patients").fetchall()
+                return rows if factory else convert(rows)
+            
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                rows = fetch()
+                times.append(time.perf_counter() - t0)
+            elapsed = min(times)
+            base = base or elapsed
+            # row.name, row['name'] or row[2], through operator so the loop itself costs nothing
+            if hasattr(rows[0], 'name'):
+                get = operator.attrgetter('name')
+            else:
+                get = operator.itemgetter(2 if type(rows[0]) is tuple else 'name')
+            t0 = time.perf_counter()
+            collections.deque(map(get, rows), 0)
+            read = f"{(time.perf_counter() - t0) / len(rows) * 1e9:,.0f} ns"
+            row_bytes = f"{size:,.0f}" if size else "(the tuple)"
+            print(f"{label:20} | {row_bytes:>12} | {elapsed * 1e6 / len(rows):>10.2f} µs | "
+                  f"{elapsed / base:>7.2f}x | {read:>14}")
+        print("-"*80)
+        print_row("Plain tuple:", f"{sys.getsizeof(shared[0])} B per row object; the values come on top in every shape")
+
+# ============================================================================
+# PATIENT SEARCH LATENCY
+# ============================================================================
+
+def _misspell(word):
+    # Swap two letters in the middle, the most common typing slip
+    i = len(word) // 2
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+def bench_search(args):
+    import random
+    rnd = random.Random(args.seed)
+    
+    print_header("PATIENT SEARCH LATENCY")
+    with temp_system() as system:
+        start = time.perf_counter()
+        add_patients(system, args.patients)
+        print_row("Patients:", f"{args.patients:,} (loaded in {time.perf_counter() - start:.1f}s)")
+        
+        samples = [rnd.randrange(args.patients) for _ in range(args.queries)]
+        kinds = {
+            "name prefix": lambda i: patient_name(i).split()[0][:3],
+            "full name": lambda i: patient_name(i),
+            "surname": lambda i: patient_name(i).split()[1],
+            "phone prefix": lambda i: f"9{i * 7919 % 10**9:09d}"[:6],
+            "patient id": lambda i: hospital.format_id("P", i + 1)[:-2],
+            "fuzzy name": lambda i: _misspell(patient_name(i).split()[0]),
+        }
+        
+        print(f"\n{'Query':14} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'hits/query':>10}")
+        print("-"*60)
+        for kind, make_query in kinds.items():
+            fuzzy = kind == "fuzzy name"
+            timings, hits = [], 0
+            for i in samples:
+                query = make_query(i)
+                t0 = time.perf_counter()
+                hits += len(system.search_patients(query, fuzzy=fuzzy))
+                timings.append((time.perf_counter() - t0) * 1000)
+            pct = percentiles(timings)
+            print(f"{kind:14} | {pct[50]:7.2f} | {pct[95]:7.2f} | {pct[99]:7.2f} | {hits / len(samples):10.1f}")
+        print("-"*60)
+
+# ============================================================================
+# MIXED READ/WRITE THROUGHPUT
+# ============================================================================
+
+def _mixed_worker(system, patients, read_ratio, seed, stop, results):
+    import random
+    rnd = random.Random(seed)
+    reads = writes = 0
+    while not stop.is_set():
+        if rnd.random() < read_ratio:
+            patient_id = hospital.format_id("P", rnd.randint(1, patients))
+            system.db.cursor.execute("SELECT * FROM patients WHERE patient_id = ?", (patient_id,))
+            system.db.cursor.fetchone()
+            system.db.cursor.execute(hospital.APPOINTMENTS_ON_DATE_SQL, ("2024-06-01",))
+            system.db.cursor.fetchone()
+            reads += 1
+        else:
+            patient_id = system.generate_id("P", "patients")
+            system.db.cursor.execute(
+                "INSERT INTO patients (patient_id, name, age, gender, phone, address) VALUES (?, ?, ?, ?, ?, ?)",
+                (patient_id, "Walk In", 30, "F", "9000000000", "Desk")
+            )
+            system.db.conn.commit()
+            writes += 1
+    results.append((reads, writes))
+
+def bench_db(args):
+    import threading
+    
+    print_header("MIXED READ/WRITE THROUGHPUT")
+    print_row("Threads:", args.threads)
+    print_row("Reads:", f"{args.read_ratio:.0%}")
+    print_row("Duration per setup:", f"{args.seconds}s")
+    print("-"*60)
+    
+    setups = [
+        ("old defaults (rollback journal, FULL)", {}),
+        ("WAL + tuned pragmas", None),
+    ]
+    for label, pragmas in setups:
+        with temp_system(pragmas=pragmas) as system:
+            add_patients(system, args.patients)
+            stop, results = threading.Event(), []
+            threads = [
+                threading.Thread(target=_mixed_worker,
+                                 args=(system, args.patients, args.read_ratio, n, stop, results))
+                for n in range(args.threads)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        
+        reads = sum(r for r, _ in results)
+        writes = sum(w for _, w in results)
+        print_row("Setup:", label)
+        print_row("Reads/sec:", f"{reads / args.seconds:,.0f}")
+        print_row("Writes/sec:", f"{writes / args.seconds:,.0f}")
+        print_row("Total ops/sec:", f"{(reads + writes) / args.seconds:,.0f}")
+        print("-"*60)
+
+# ============================================================================
+# SERVICE LAYER OPERATIONS
+# ============================================================================
+
+def _ops_per_sec(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return count / (time.perf_counter() - start)
+
+def bench_service(args):
+    print_header("SERVICE LAYER THROUGHPUT (no terminal I/O)")
+    print_row("Operations per test:", f"{args.count:,}")
+    print("-"*60)
+    
+    with temp_system() as system:
+        service = system.service
+        add_patients(system, args.patients)
+        patient_ids = [hospital.format_id("P", i + 1) for i in range(args.patients)]
+        slots = service.next_free_slots(from_date="2024-06-03", count=args.count)
+        
+        tests = [
+            ("register_patient", lambda i: service.register_patient(patient_name(i), 30, "F", "9000000000", "Desk")),
+            ("get_patient", lambda i: service.get_patient(patient_ids[i % len(patient_ids)])),
+            ("search_patients", lambda i: service.search_patients(patient_name(i))),
+            ("book", lambda i: service.book(patient_ids[i % len(patient_ids)], slots[i][2], *slots[i][:2])),
+            ("add_medicine", lambda i: service.add_medicine(f"Medicine {i}", 100, 12.5, "2027-01-31")),
+            ("create_bill", lambda i: service.create_bill(patient_ids[i % len(patient_ids)], [("Dressing", 1, 500)], 200)),
+            ("statistics", lambda i: service.statistics()),
+        ]
+        for name, fn in tests:
+            print_row(f"{name}:", f"{_ops_per_sec(fn, args.count):>10,.0f} ops/sec")
+        
+        def batched(i):
+            with service.transaction():
+                for j in range(100):
+                    service.register_patient(patient_name(j), 30, "F", "9000000000", "Desk")
+        rate = _ops_per_sec(batched, max(1, args.count // 100)) * 100
+        print_row("register_patient (100/commit):", f"{rate:>10,.0f} ops/sec")
+    print("-"*60)
+
+# ============================================================================
+# LOOKUP CACHE
+# ============================================================================
+
+def bench_cache(args):
+    import random
+    
+    print_header("PATIENT/DOCTOR LOOKUPS: CACHE OFF vs ON")
+    print_row("Lookups per test:", f"{args.count:,} ({args.patients:,} patients, {args.hot:,} hot)")
+    print_row("Foreign commit every:", f"{args.write_every:,} lookups" if args.write_every else "never")
+    print("-"*60)
+    
+    for label, size in [("off", 0), ("on", hospital.CACHE_SIZE)]:
+        with temp_system(cache_size=size) as system:
+            service = system.service
+            add_patients(system, args.patients)
+            _add_doctors(system, args.doctors)
+            # Desks keep coming back to the patients and doctors of the day
+            rnd = random.Random(args.seed)
+            patients = [hospital.format_id("P", rnd.randrange(args.patients) + 1) for _ in range(args.hot)]
+            doctors = [f"BDOC{i:04d}" for i in range(args.doctors)]
+            other = sqlite3.connect(system.db.path)
+            
+            tests = [
+                ("get_patient", lambda i: service.get_patient(patients[rnd.randrange(len(patients))])),
+                ("get_doctor", lambda i: service.get_doctor(doctors[i % len(doctors)])),
+                ("list_doctors", lambda i: service.list_doctors()),
+            ]
+            for name, fn in tests:
+                samples = []
+                for i in range(args.count):
+                    if args.write_every and i % args.write_every == 0:
+                        # Another desk books something: data_version moves, the roster does not
+                        other.execute("UPDATE stat_counters SET value = value WHERE name = 'patients'")
+                        other.commit()
+                    start = time.perf_counter()
+                    fn(i)
+                    samples.append((time.perf_counter() - start) * 1e6)
+                pct = percentiles(samples)
+                print_row(f"{name} (cache {label}):", f"p50 {pct[50]:7.1f} us  p99 {pct[99]:7.1f} us")
+            other.close()
+            if size:
+                stats = service.cache_stats()
+                print_row("Hit rate:", f"{stats['hit_rate']:.1%} ({stats['hits']:,} hits, {stats['misses']:,} misses)")
+    print("-"*60)
+
+# ============================================================================
+# INSTRUMENTATION OVERHEAD
+# ============================================================================
+
+def bench_metrics(args):
+    import gc
+    import statistics
+    
+    print_header("QUERY INSTRUMENTATION OVERHEAD")
+    print_row("Operations per round:", f"{args.count:,} x {args.rounds} rounds, sides interleaved")
+    print("-"*76)
+    
+    # "off again" is a second uninstrumented database: its column is the
+    # noise floor the other overheads have to be read against
+    sides = {
+        "off": None,
+        "off again": None,
+        "all timed": hospital.QueryMetrics(sample_every=1),
+        f"1/{args.sample} timed": hospital.QueryMetrics(sample_every=args.sample),
+    }
+    names = ("get_patient", "search_patients", "register_patient", "book", "create_bill", "statistics")
+    with contextlib.ExitStack() as stack:
+        tests = {}
+        for label, metrics in sides.items():
+            # Connections opened while QueryMetrics.active is set are timed
+            hospital.QueryMetrics.active = metrics
+            try:
+                system = stack.enter_context(temp_system())
+            finally:
+                hospital.QueryMetrics.active = None
+            service = system.service
+            add_patients(system, args.patients)
+            _add_doctors(system, 50)
+            patient_ids = [hospital.format_id("P", i + 1) for i in range(args.patients)]
+            slots = iter(service.next_free_slots(from_date="2024-06-03", count=args.count * args.rounds))
+            
+            def book(i, service=service, slots=slots, patient_ids=patient_ids):
+                date, time_, doctor_id = next(slots)
+                service.book(patient_ids[i % len(patient_ids)], doctor_id, date, time_)
+            
+            tests[label] = {
+                "get_patient": lambda i, s=service, ids=patient_ids: s.get_patient(ids[i % len(ids)]),
+                "search_patients": lambda i, s=service: s.search_patients(patient_name(i)),
+                "register_patient": lambda i, s=service: s.register_patient(patient_name(i), 30, "F", "9000000000"),
+                "book": book,
+                "create_bill": lambda i, s=service, ids=patient_ids: s.create_bill(ids[i % len(ids)], [("Dressing", 1, 500)]),
+                "statistics": lambda i, s=service: s.statistics(),
+            }
+        
+        # The machine's speed drifts; rotating which side goes first and
+        # taking the median per-round ratio cancels most of it out
+        labels = list(sides)
+        rates = {(name, label): [] for name in names for label in labels}
+        gc.disable()
+        try:
+            for round_no in range(args.rounds):
+                order = labels[round_no % len(labels):] + labels[:round_no % len(labels)]
+                for name in names:
+                    for label in order:
+                        rates[name, label].append(_ops_per_sec(tests[label][name], args.count))
+        finally:
+            gc.enable()
+    
+    print(f"{'operation':18} | {'off ops/s':>10} | " + " | ".join(f"{label:>13}" for label in labels[1:]))
+    print("-"*76)
+    for name in names:
+        off = rates[name, "off"]
+        cells = []
+        for label in labels[1:]:
+            overhead = statistics.median(a / b for a, b in zip(off, rates[name, label])) - 1
+            cells.append(f"{overhead * 100:+12.1f}%")
+        print(f"{name:18} | {statistics.median(off):>10,.0f} | " + " | ".join(cells))
+    print("-"*76)
+    statements = sides["all timed"].snapshot()['queries']
+    print_row("Statements tracked:", len(statements))
+    print_row("Executions recorded:", f"{sum(q['count'] for q in statements):,}")
+    
+    # The cost added to one cheap statement, best of several runs: steadier
+    # than the ratios above, which move with the machine
+    def per_statement(metrics):
+        if metrics is None:
+            conn = sqlite3.connect(":memory:")
+        else:
+            conn = sqlite3.connect(":memory:", factory=hospital.InstrumentedConnection)
+            conn.metrics = metrics
+        conn.execute("CREATE TABLE t (a, b)")
+        conn.execute("INSERT INTO t VALUES (1, 2)")
+        
+        def run():
+            cursor = conn.cursor()
+            cursor.execute("SELECT b FROM t WHERE a = ?", (1,))
+            cursor.fetchall()
+        
+        best = min(_ops_per_sec(lambda i: run(), args.count * 20) for _ in range(args.rounds))
+        conn.close()
+        return 1e6 / best
+    
+    base = per_statement(None)
+    print_row("Cheap statement, off:", f"{base:.2f} us")
+    for label, metrics in sides.items():
+        if metrics is not None:
+            print_row(f"  + {label}:", f"{per_statement(hospital.QueryMetrics(sample_every=metrics.sample_every)) - base:+.2f} us")
+
+# ============================================================================
+# DASHBOARD STATISTICS
+# ============================================================================
+
+def _add_activity(system, patients):
+    # One appointment and one bill per patient; appointments spread over
+    # 100 doctors and a year so no two share a doctor's slot
+    import datetime
+    first_day = datetime.date(2024, 1, 1)
+    system.db.cursor.executemany(
+        "INSERT INTO appointments (appointment_id, patient_id, doctor_id, date, time) VALUES (?, ?, ?, ?, ?)",
+        ((hospital.format_id("BAPT", i), hospital.format_id("P", i + 1), f"BDOC{i % 100:04d}",
+          (first_day + datetime.timedelta(days=i // 100 % 366)).isoformat(), hospital.to_hhmm(i // 36600 % 1440))
+         for i in range(patients))
+    )
+    system.db.cursor.executemany(
+        "INSERT INTO bills (bill_no, patient_id, total_paise, paid_paise, status) VALUES (?, ?, 50000, ?, ?)",
+        ((hospital.format_id("BBILL", i), hospital.format_id("P", i + 1), 50000 * (i % 2), ["Pending", "Paid"][i % 2])
+         for i in range(patients))
+    )
+    system.db.conn.commit()
+
+def bench_stats(args):
+    print_header("DASHBOARD LATENCY vs TABLE SIZE")
+    print(f"\n{'Rows/table':>10} | {'aggregates p50':>14} | {'p99':>11} | {'counters p50':>14} | {'p99':>11}")
+    print("-"*74)
+    
+    for size in args.sizes:
+        with temp_system() as system:
+            add_patients(system, size)
+            _add_activity(system, size)
+            service = system.service
+            row = [f"{size:>10,}"]
+            for exact in (True, False):
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    service.statistics(exact=exact)
+                    timings.append((time.perf_counter() - start) * 1000)
+                pct = percentiles(timings)
+                row += [f"{pct[50]:>11.3f} ms", f"{pct[99]:>8.3f} ms"]
+            assert service.statistics() == service.statistics(exact=True)
+            print(" | ".join(row))
+    print("-"*74)
+
+# ============================================================================
+# PHARMACY INVENTORY
+# ============================================================================
+
+def _dispense_worker(path, medicines, count, seed, start_at, queue):
+    import random
+    rnd = random.Random(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = hospital.SimpleHospitalSystem(db_path=path)
+    dispensed, short, timings = 0, 0, []
+    while time.time() < start_at:
+        pass
+    for _ in range(count):
+        units = rnd.randint(1, 5)
+        start = time.perf_counter()
+        try:
+            system.service.dispense(f"Medicine {rnd.randrange(medicines)}", units, "bench")
+            dispensed += units
+        except hospital.OutOfStockError:
+            short += 1
+        timings.append((time.perf_counter() - start) * 1000)
+    system.close()
+    queue.put((dispensed, short, timings))
+
+def bench_pharmacy(args):
+    import datetime
+    
+    print_header("PHARMACY: FEFO DISPENSING UNDER CONCURRENT COUNTERS")
+    today = datetime.date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hospital.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = hospital.SimpleHospitalSystem(db_path=path)
+        # Batches expire from last month to three years out; past ones must never be dispensed
+        system.db.cursor.executemany(
+            "INSERT INTO medicines (name, quantity, price_paise, expiry, batch_no) VALUES (?, ?, 1000, ?, ?)",
+            ((f"Medicine {i % args.medicines}", args.batch_units,
+              (today + datetime.timedelta(days=i * 7919 % 1125 - 30)).isoformat(), f"B{i}")
+             for i in range(args.medicines * args.batches))
+        )
+        system.db.conn.commit()
+        service = system.service
+        start = time.perf_counter()
+        expired = service.expire_stock()
+        print_row("Batches:", f"{args.medicines * args.batches:,} ({args.medicines:,} medicines)")
+        print_row("Expired batches written off:", f"{len(expired):,} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        units_before = service.statistics()['medicine_units']
+        
+        for label, fn in [("Low stock list:", service.low_stock),
+                          ("Expiring within 30 days:", lambda: service.expiring_stock(30))]:
+            samples = []
+            for _ in range(20):
+                begin = time.perf_counter()
+                rows = fn()
+                samples.append((time.perf_counter() - begin) * 1000)
+            print_row(label, f"{percentiles(samples)[50]:.2f} ms p50 ({len(rows):,} rows)")
+        system.close()
+        
+        queue = multiprocessing.Queue()
+        start_at = time.time() + 1.0
+        workers = [
+            multiprocessing.Process(target=_dispense_worker,
+                                    args=(path, args.medicines, args.count, seed, start_at, queue))
+            for seed in range(args.counters)
+        ]
+        for worker in workers:
+            worker.start()
+        results = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start_at
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = hospital.SimpleHospitalSystem(db_path=path)
+        service = system.service
+        units_after = service.statistics()['medicine_units']
+        unbalanced = service.check_stock()
+        expired_dispensed = system.db.conn.execute('''
+            SELECT COUNT(*) FROM stock_movements s JOIN medicines m ON m.id = s.medicine_id
+            WHERE s.reason = 'dispense' AND m.expiry < DATE(s.created_at)
+        ''').fetchone()[0]
+        negative = system.db.conn.execute("SELECT COUNT(*) FROM medicines WHERE quantity < 0").fetchone()[0]
+        system.close()
+    
+    dispensed = sum(r[0] for r in results)
+    timings = [ms for r in results for ms in r[2]]
+    pct = percentiles(timings)
+    print("-"*60)
+    print_row("Counters:", f"{args.counters} x {args.count:,} dispenses")
+    print_row("Throughput:", f"{len(timings) / elapsed:,.0f} dispenses/sec")
+    print_row("Latency p50/p99:", f"{pct[50]:.2f} / {pct[99]:.2f} ms")
+    print_row("Out-of-stock refusals:", sum(r[1] for r in results))
+    print_row("Units dispensed:", f"{dispensed:,} (stock fell by {units_before - units_after:,})")
+    print_row("Batches off the ledger:", len(unbalanced))
+    print_row("Negative batches:", negative)
+    print_row("Expired units dispensed:", expired_dispensed)
+    print("-"*60)
+
+# ============================================================================
+# BILLING
+# ============================================================================
+
+def _add_charges(system, patients, date):
+    # One consultation and two dispensed medicines per patient on `date`
+    add_patients(system, patients)
+    doctors = _add_doctors(system, patients // 1440 + 1)
+    cursor = system.db.cursor
+    cursor.executemany(
+        "INSERT INTO appointments (appointment_id, patient_id, doctor_id, date, time) VALUES (?, ?, ?, ?, ?)",
+        ((hospital.format_id("BAPT", i), hospital.format_id("P", i + 1), doctors[i // 1440], date,
+          hospital.to_hhmm(i % 1440)) for i in range(patients))
+    )
+    cursor.execute("SELECT id FROM medicines ORDER BY id")
+    batches = [row[0] for row in cursor.fetchall()]
+    cursor.executemany(
+        "INSERT INTO stock_movements (medicine_id, change, reason, patient_id, created_at) VALUES (?, -1, 'dispense', ?, ?)",
+        ((batches[(i + n) % len(batches)], hospital.format_id("P", i + 1), f"{date} 12:00:00")
+         for i in range(patients) for n in range(2))
+    )
+    system.db.conn.commit()
+
+def bench_billing(args):
+    import datetime
+    
+    print_header("BILLING: END-OF-DAY INVOICING vs ONE BILL AT A TIME")
+    date = datetime.date.today().isoformat()
+    print_row("Patients with charges:", f"{args.patients:,} (1 consultation + 2 medicines each)")
+    print("-"*60)
+    
+    with temp_system() as system:
+        _add_charges(system, args.patients, date)
+        start = time.perf_counter()
+        for i in range(args.patients):
+            system.service.create_bill(hospital.format_id("P", i + 1))
+        elapsed = time.perf_counter() - start
+        print_row("create_bill per patient:", f"{elapsed:6.2f}s  {args.patients / elapsed:>8,.0f} bills/sec")
+    
+    for batch_size in args.batch_sizes:
+        with temp_system() as system:
+            _add_charges(system, args.patients, date)
+            start = time.perf_counter()
+            result = system.service.invoice_day(date, batch_size)
+            elapsed = time.perf_counter() - start
+            items = system.db.conn.execute("SELECT COUNT(*) FROM bill_items").fetchone()[0]
+            assert result['bills'] == args.patients and items == 3 * args.patients
+            print_row(f"invoice_day (batch {batch_size:,}):", f"{elapsed:6.2f}s  {result['bills'] / elapsed:>8,.0f} bills/sec")
+    print("-"*60)
+
+# ============================================================================
+# FINANCIAL REPORTS
+# ============================================================================
+
+def bench_reports(args):
+    import datetime
+    
+    print_header("FINANCIAL REPORTS OVER YEARS OF BILLS")
+    today = datetime.date.today()
+    first_day = today - datetime.timedelta(days=365 * args.years)
+    days = (today - first_day).days + 1
+    
+    with temp_system() as system:
+        add_patients(system, 1)
+        system.db.cursor.executemany(
+            "INSERT INTO bills (bill_no, patient_id, total_paise, paid_paise, status, created_at) VALUES (?, 'P00000001', ?, ?, ?, ?)",
+            ((hospital.format_id("BBILL", i), 100 * (100 + i % 900), 100 * (100 + i % 900) * (i % 3 // 2), ["Pending", "Pending", "Paid"][i % 3],
+              f"{first_day + datetime.timedelta(days=i // args.per_day)} {9 + i % 8:02d}:{i % 60:02d}:00")
+             for i in range(days * args.per_day))
+        )
+        system.db.conn.commit()
+        service = system.service
+        print_row("Bills:", f"{days * args.per_day:,} ({args.per_day:,}/day over {args.years} years)")
+        
+        start = time.perf_counter()
+        closed = service.close_days()
+        print_row("Closing all past days once:", f"{closed:,} days in {time.perf_counter() - start:.2f}s")
+        
+        month_start = today.replace(day=1)
+        year_start = today.replace(month=1, day=1)
+        cursor = system.db.conn.cursor()
+        
+        def raw(first, last):
+            # What the report costs without rollups: aggregate the bills themselves
+            cursor.execute(hospital.BILLS_BETWEEN_SQL, (first.isoformat(), (last + datetime.timedelta(days=1)).isoformat()))
+            return cursor.fetchall()
+        
+        tests = [
+            ("today", lambda: service.daily_report(today), lambda: raw(today, today)),
+            ("month to date", lambda: service.financial_report(month_start, today), lambda: raw(month_start, today)),
+            ("year to date", lambda: service.financial_report(year_start, today), lambda: raw(year_start, today)),
+            ("YTD vs last year", lambda: service.period_report('ytd', today),
+             lambda: (raw(year_start, today), raw(year_start.replace(year=today.year - 1), hospital._year_earlier(today)))),
+            (f"all {args.years} years", lambda: service.financial_report(first_day, today), lambda: raw(first_day, today)),
+        ]
+        print(f"\n{'Report':18} | {'bills p50':>10} | {'rollups p50':>12} | {'rollups p99':>12}")
+        print("-"*60)
+        for name, rolled, scan in tests:
+            timings = {}
+            for label, fn in [("raw", scan), ("rollup", rolled)]:
+                samples = []
+                for _ in range(args.repeat):
+                    begin = time.perf_counter()
+                    fn()
+                    samples.append((time.perf_counter() - begin) * 1000)
+                timings[label] = percentiles(samples)
+            print(f"{name:18} | {timings['raw'][50]:>7.2f} ms | {timings['rollup'][50]:>9.2f} ms | {timings['rollup'][99]:>9.2f} ms")
+        print("-"*60)
+
+# ============================================================================
+# BULK IMPORT
+# ============================================================================
+
+def bench_import(args):
+    import csv
+    import resource
+    
+    print_header("BULK IMPORT")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "patients.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "age", "gender", "phone", "address", "reg_date"])
+            for i in range(args.rows):
+                # Every 1000th row has no name and is rejected
+                writer.writerow([patient_name(i) if i % 1000 else "", 20 + i % 60, "MF"[i % 2],
+                                 f"9{i:09d}", CITIES[i % len(CITIES)], "2024-05-01"])
+        print_row("Rows in file:", f"{args.rows:,} ({os.path.getsize(path) / 2**20:.0f} MB)")
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = hospital.SimpleHospitalDB(os.path.join(tmp, "hospital.db"))
+        ids = hospital.IdAllocator(db)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        importer = hospital.BulkImporter(db, ids, "patients", args.batch_size, os.path.join(tmp, "rejects.jsonl"))
+        summary = importer.run(path)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        ids.close()
+        db.close()
+    
+    print_row("Inserted:", f"{summary['inserted']:,}")
+    print_row("Rejected:", f"{summary['rejected']:,}")
+    print_row("Time:", f"{summary['seconds']:.1f}s")
+    print_row("Throughput:", f"{summary['rows_per_sec']:,.0f} rows/sec")
+    print_row("Peak RSS growth:", f"{(rss_after - rss_before) / 1024:.1f} MB")
+    print("-"*60)
+
+# ============================================================================
+# HTTP API LOAD TEST
+# ============================================================================
+
+async def _http_request(reader, writer, method, path, body=None):
+    import json
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+        + payload
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+async def _api_client(port, seed, requests, patients, results):
+    import asyncio
+    import random
+    rnd = random.Random(seed)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(requests):
+        roll = rnd.random()
+        if roll < 0.70:
+            kind, method, path, body = "GET patient", "GET", f"/patients/{hospital.format_id('P', rnd.randint(1, patients))}", None
+        elif roll < 0.85:
+            kind, method, path, body = "search", "GET", f"/patients?q={patient_name(rnd.randrange(patients)).split()[0]}&limit=10", None
+        elif roll < 0.95:
+            kind, method, path, body = "POST patient", "POST", "/patients", {"name": "Kiosk Walk In", "age": 30}
+        else:
+            kind, method, path, body = "statistics", "GET", "/reports/statistics", None
+        start = time.perf_counter()
+        status = await _http_request(reader, writer, method, path, body)
+        results.append((kind, status, (time.perf_counter() - start) * 1000))
+    writer.close()
+
+def bench_api(args):
+    import asyncio
+    import socket
+    import subprocess
+    
+    print_header("HTTP API LOAD TEST")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "hospital.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = hospital.SimpleHospitalSystem(db_path=db_path)
+        add_patients(system, args.patients)
+        system.close()
+        
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = subprocess.Popen(
+            [sys.executable, hospital.__file__, "--db", db_path, "serve", "--port", str(port),
+             "--workers", str(args.workers)],
+            stdout=subprocess.PIPE, text=True
+        )
+        try:
+            server.stdout.readline()   # ready line
+            
+            results = []
+            
+            async def run_clients():
+                await asyncio.gather(*(
+                    _api_client(port, n, args.requests, args.patients, results) for n in range(args.clients)
+                ))
+            
+            start = time.perf_counter()
+            asyncio.run(run_clients())
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+    
+    print_row("Concurrent clients:", args.clients)
+    print_row("DB worker threads:", args.workers)
+    print_row("Requests:", f"{len(results):,} in {elapsed:.1f}s")
+    print_row("Throughput:", f"{len(results) / elapsed:,.0f} req/sec")
+    print_row("Errors (5xx):", sum(1 for _, status, _ in results if status >= 500))
+    print(f"\n{'Endpoint':14} | {'count':>6} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7}")
+    print("-"*60)
+    kinds = sorted({kind for kind, _, _ in results})
+    for kind in kinds + ["all"]:
+        timings = [ms for k, _, ms in results if kind in (k, "all")]
+        pct = percentiles(timings)
+        print(f"{kind:14} | {len(timings):>6} | {pct[50]:7.2f} | {pct[95]:7.2f} | {pct[99]:7.2f}")
+    print("-"*60)
+
+# ============================================================================
+# SCHEDULING
+# ============================================================================
+
+def _add_doctors(system, count):
+    rows = [(f"BDOC{i:04d}", f"Dr. {patient_name(i)}", ["Cardiology", "Pediatrics", "Orthopedics"][i % 3], 50000, "")
+            for i in range(count)]
+    system.db.cursor.executemany(
+        "INSERT INTO doctors (doctor_id, name, specialization, fee_paise, phone) VALUES (?, ?, ?, ?, ?)", rows
+    )
+    system.db.conn.commit()
+    return [row[0] for row in rows]
+
+def _book_worker(path, patient_id, slots, start_at, queue):
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = hospital.SimpleHospitalSystem(db_path=path)
+    booked, conflicts = [], 0
+    while time.time() < start_at:
+        pass
+    for doctor_id, date, slot in slots:
+        try:
+            system.service.book(patient_id, doctor_id, date, slot)
+            booked.append((doctor_id, date, slot))
+        except hospital.SlotConflictError:
+            conflicts += 1
+    system.close()
+    queue.put((booked, conflicts))
+
+def bench_schedule(args):
+    import datetime
+    import random
+    
+    print_header("DOCTOR SLOT SCHEDULING")
+    rnd = random.Random(args.seed)
+    # Mondays onwards, so the default Mon-Sat hours apply
+    today = datetime.date.today()
+    first_day = today + datetime.timedelta(days=7 - today.weekday())
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hospital.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = hospital.SimpleHospitalSystem(db_path=path)
+        add_patients(system, 1)
+        doctors = _add_doctors(system, args.doctors)
+        
+        # Book the given share of every slot over the next --days days
+        slot_times = [hospital.to_hhmm(m) for m in range(9 * 60, 17 * 60, 15)]
+        days = [first_day + datetime.timedelta(days=d) for d in range(args.days)]
+        days = [d.isoformat() for d in days if d.weekday() < 6]
+        rows = (
+            (hospital.format_id("BAPT", n), "P00000001", doctor, day, slot, 15)
+            for n, (doctor, day, slot) in enumerate(
+                (doctor, day, slot) for doctor in doctors for day in days for slot in slot_times
+                if rnd.random() < args.fill
+            )
+        )
+        system.db.cursor.executemany(
+            "INSERT INTO appointments (appointment_id, patient_id, doctor_id, date, time, duration) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        system.db.conn.commit()
+        total = system.db.conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        print_row("Doctors:", args.doctors)
+        print_row("Appointments:", f"{total:,} ({args.fill:.0%} of slots)")
+        
+        scheduler = system.service.scheduler
+        cursor = system.db.conn.cursor()
+        timings = []
+        for _ in range(args.queries):
+            doctor, day, slot = rnd.choice(doctors), rnd.choice(days), rnd.choice(slot_times)
+            start = time.perf_counter()
+            scheduler.find_conflict(cursor, doctor, day, slot, 15)
+            timings.append((time.perf_counter() - start) * 1000)
+        pct = percentiles(timings)
+        print_row("Conflict check p50/p99:", f"{pct[50]:.3f} / {pct[99]:.3f} ms")
+        
+        for label, query in [
+            ("Next 10 slots, one doctor:", lambda: system.service.free_slots(rnd.choice(doctors), first_day, 10)),
+            ("Next 10 slots, specialization:", lambda: system.service.next_free_slots("Pediatrics", first_day, 10)),
+        ]:
+            timings = []
+            for _ in range(max(1, args.queries // 10)):
+                start = time.perf_counter()
+                query()
+                timings.append((time.perf_counter() - start) * 1000)
+            pct = percentiles(timings)
+            print_row(label, f"{pct[50]:.3f} / {pct[99]:.3f} ms (p50/p99)")
+        
+        # Every desk tries to book the same free slots at the same moment
+        free = system.service.free_slots(doctors[0], first_day, args.race_slots)
+        slots = [(doctors[0], day, slot) for day, slot in free]
+        system.close()
+        
+        queue = multiprocessing.Queue()
+        start_at = time.time() + 1.0
+        workers = [
+            multiprocessing.Process(target=_book_worker, args=(path, "P00000001", slots, start_at, queue))
+            for _ in range(args.desks)
+        ]
+        for worker in workers:
+            worker.start()
+        results = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+    
+    booked = [slot for worker_booked, _ in results for slot in worker_booked]
+    print("-"*60)
+    print_row("Desks racing:", f"{args.desks} x {len(slots)} slots")
+    print_row("Bookings made:", len(booked))
+    print_row("Rejected as taken:", sum(c for _, c in results))
+    print_row("Double bookings:", len(booked) - len(set(booked)))
+    print("-"*60)
+
+# ============================================================================
+# APPOINTMENT AGENDA AND LIFECYCLE
+# ============================================================================
+
+def bench_agenda(args):
+    # Generated a week in the past, so the last week's bookings are unattended
+    today = datetime.date.today()
+    anchor = today - datetime.timedelta(days=7)
+    with temp_system(sample_data=False) as system:
+        generate_dataset(system, args.patients, args.seed, anchor)
+        service = system.service
+        cursor = system.db.conn.cursor()
+        appointments = cursor.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        doctor_id, specialization = cursor.execute(
+            "SELECT a.doctor_id, d.specialization FROM appointments a JOIN doctors d ON a.doctor_id = d.doctor_id "
+            "GROUP BY a.doctor_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+        start = (today - datetime.timedelta(days=args.days)).isoformat()
+        end = today.isoformat()
+        
+        print_header("AGENDA: DATE RANGE, STREAMED IN KEYSET PAGES")
+        print_row("Dataset:", f"{args.patients:,} patients, {appointments:,} appointments (seed {args.seed})")
+        print_row("Range:", f"{start} .. {end} ({args.days} days)")
+        print(f"\n{'agenda':34} | {'rows':>9} | {'first row ms':>12} | {'all rows ms':>11} | {'matches COUNT':>13}")
+        print("-"*92)
+        cases = [
+            (f"doctor {doctor_id}", {'doctor_id': doctor_id}, "doctor_id = ?", (doctor_id,)),
+            (f"department {specialization}", {'specialization': specialization},
+             "doctor_id IN (SELECT doctor_id FROM doctors WHERE specialization = ?)", (specialization,)),
+            ("whole hospital", {}, "1", ()),
+        ]
+        for label, kwargs, where, params in cases:
+            t0 = time.perf_counter()
+            rows = service.agenda(start, end, **kwargs)
+            next(rows, None)
+            first = (time.perf_counter() - t0) * 1000
+            count = 1 + sum(1 for _ in rows)
+            total = (time.perf_counter() - t0) * 1000
+            expected = cursor.execute(
+                f"SELECT COUNT(*) FROM appointments WHERE date BETWEEN ? AND ? AND {where}", (start, end, *params)
+            ).fetchone()[0]
+            print(f"{label[:34]:34} | {count:>9,} | {first:>12.2f} | {total:>11.1f} | "
+                  f"{'✅' if count == expected else f'❌ {expected:,}':>13}")
+        print("-"*92)
+        
+        print_header("LIFECYCLE TRANSITIONS")
+        scheduled = [row[0] for row in cursor.execute(
+            "SELECT appointment_id FROM appointments WHERE status = 'Scheduled' AND date >= ? LIMIT ?",
+            (end, args.count)).fetchall()]
+        times = []
+        for appointment_id in scheduled:
+            t0 = time.perf_counter()
+            service.transition(appointment_id, 'check_in')
+            times.append((time.perf_counter() - t0) * 1000)
+        pct = percentiles(times)
+        print_row("Single check-in:", f"{len(times):,} calls, p50 {pct[50]:.3f} ms, p99 {pct[99]:.3f} ms")
+        
+        unattended = cursor.execute(
+            "SELECT COUNT(*) FROM appointments WHERE status = 'Scheduled' AND date < ?", (end,)).fetchone()[0]
+        t0 = time.perf_counter()
+        changed = service.mark_no_shows()
+        elapsed = (time.perf_counter() - t0) * 1000
+        print_row("Bulk no-show (one UPDATE):", f"{changed:,} rows in {elapsed:.1f} ms "
+                  f"({'✅' if changed == unattended else f'❌ expected {unattended:,}'})")
+        history = cursor.execute("SELECT COUNT(*) FROM appointment_transitions").fetchone()[0]
+        print_row("History rows written:", f"{history:,}")
+
+# ============================================================================
+# BATCH COMMANDS
+# ============================================================================
+
+def _night_job(system, anchor, count, rnd):
+    # A nightly script: lookups, rebooking into free slots, payments against open bills, dispensing
+    cursor = system.db.conn.cursor()
+    patients = cursor.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+    bills = [row[0] for row in cursor.execute("SELECT bill_no FROM bills WHERE status != 'Paid'").fetchall()]
+    medicines = [row[0] for row in cursor.execute("SELECT DISTINCT name FROM medicines").fetchall()]
+    slots = iter(system.service.next_free_slots(from_date=anchor + datetime.timedelta(days=1), count=count))
+    lines = []
+    for i in range(count):
+        patient_id = hospital.format_id("P", 1 + rnd.randrange(patients))
+        kind = i % 10
+        if kind < 5:
+            command = {'op': 'get_patient', 'patient_id': patient_id}
+        elif kind < 7:
+            date, time_, doctor_id = next(slots)
+            command = {'op': 'book', 'patient_id': patient_id, 'doctor_id': doctor_id, 'date': date, 'time': time_}
+        elif kind < 9:
+            command = {'op': 'record_payment', 'bill_no': bills[rnd.randrange(len(bills))], 'amount': "1"}
+        else:
+            command = {'op': 'dispense', 'name': rnd.choice(medicines), 'quantity': 1, 'patient_id': patient_id}
+        command['id'] = i
+        lines.append(json.dumps(command))
+    return lines
+
+def bench_batch(args):
+    anchor = datetime.date.today()
+    print_header("BATCH COMMANDS: ONE TRANSACTION PER BATCH")
+    print_row("Commands:", f"{args.count:,} (50% lookups, 20% bookings, 20% payments, 10% dispensing)")
+    print_row("Dataset:", f"{args.patients:,} patients (generated, seed {args.seed})")
+    print(f"\n{'batch size':>10} | {'ok':>7} | {'failed':>6} | {'seconds':>7} | {'ops/sec':>9}")
+    print("-"*52)
+    for batch_size in args.batch_sizes:
+        with temp_system(sample_data=False) as system:
+            generate_dataset(system, args.patients, args.seed, anchor)
+            lines = _night_job(system, anchor, args.count, random.Random(args.seed))
+            results = []
+            summary = hospital.BatchRunner(system.service, batch_size).run(lines, results.append)
+            print(f"{batch_size:>10,} | {summary['ok']:>7,} | {summary['failed']:>6,} | {summary['seconds']:>7.2f} | "
+                  f"{summary['ops_per_sec']:>9,.0f}")
+    print("-"*52)
+
+# ============================================================================
+# BRANCH SHARDS
+# ============================================================================
+
+def _branch_worker(shards, branch, count, start_at, queue):
+    # One desk registering patients as fast as it can, through the router
+    router = hospital.ShardRouter(shards)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    start = time.perf_counter()
+    for i in range(count):
+        router.call('register_patient', branch=branch, name=patient_name(i), age=30, phone=f"9{i:09d}")
+    queue.put(time.perf_counter() - start)
+    router.close()
+
+def _concurrent_writes(shards, workers, count):
+    branches = sorted(shards)
+    queue = multiprocessing.Queue()
+    start_at = time.time() + 0.5
+    procs = [
+        multiprocessing.Process(target=_branch_worker, args=(shards, branches[i % len(branches)], count, start_at, queue))
+        for i in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    elapsed = max(queue.get() for _ in procs)
+    for proc in procs:
+        proc.join()
+    return workers * count / elapsed
+
+def bench_shards(args):
+    anchor = datetime.date.today()
+    busy_day = anchor - datetime.timedelta(days=anchor.weekday() + 7)
+    with tempfile.TemporaryDirectory() as tmp:
+        def make_shards(prefix, count):
+            shards = {}
+            for n in range(count):
+                code = f"B{n + 1:02d}"
+                shards[code] = os.path.join(tmp, f"{prefix}-{code}.db")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    hospital.SimpleHospitalSystem(db_path=shards[code], sample_data=True).close()
+            return shards
+        
+        print_header("BRANCH SHARDS: CONCURRENT WRITES")
+        print_row("Writers:", f"{args.workers} processes x {args.count:,} registrations")
+        single = make_shards("single", 1)
+        sharded = make_shards("sharded", args.workers)
+        one_file = _concurrent_writes(single, args.workers, args.count)
+        per_branch = _concurrent_writes(sharded, args.workers, args.count)
+        print_row("One database:", f"{one_file:,.0f} registrations/sec")
+        print_row(f"{args.workers} branch databases:", f"{per_branch:,.0f} registrations/sec ({per_branch / one_file:.1f}x)")
+        
+        print_header("FEDERATED REPORTS")
+        shards = {}
+        for n in range(args.branches):
+            code = f"R{n + 1:02d}"
+            shards[code] = os.path.join(tmp, f"report-{code}.db")
+            with contextlib.redirect_stdout(io.StringIO()):
+                system = hospital.SimpleHospitalSystem(db_path=shards[code])
+            generate_dataset(system, args.patients, args.seed + n, anchor)
+            system.close()
+        print_row("Branches:", f"{args.branches} x {args.patients:,} patients (generated)")
+        
+        reports = [
+            ("statistics", lambda r: r.statistics()),
+            ("daily_report (busy day)", lambda r: r.daily_report(busy_day)),
+            ("financial_report (365 days)", lambda r: r.financial_report(anchor - datetime.timedelta(days=364), anchor, by_day=True)),
+            ("period_report ytd", lambda r: r.period_report('ytd', anchor)),
+        ]
+        sequential = hospital.FederatedReports(shards, processes=1)
+        parallel = hospital.FederatedReports(shards, processes=args.processes)
+        print(f"\n{'report':28} | {'1 process ms':>12} | {f'{parallel.processes}-process ms':>15} | {'totals agree':>12}")
+        print("-"*78)
+        try:
+            for label, run in reports:
+                # Warm-up: opens the databases, starts the pool, closes the days
+                run(sequential), run(parallel)
+                times = {}
+                for name, federated in (("seq", sequential), ("par", parallel)):
+                    samples = []
+                    for _ in range(args.runs):
+                        start = time.perf_counter()
+                        result = run(federated)
+                        samples.append((time.perf_counter() - start) * 1000)
+                    times[name] = (percentiles(samples, (50,))[50], result)
+                agree = times["seq"][1] == times["par"][1]
+                print(f"{label:28} | {times['seq'][0]:>12.1f} | {times['par'][0]:>15.1f} | {'✅' if agree else '❌':>12}")
+            print("-"*78)
+            total = sequential.statistics()['total']['patients']
+            print_row("Patients (merged):", f"{total:,} ({'✅' if total == args.branches * args.patients else '❌'})")
+        finally:
+            sequential.close()
+            parallel.close()
+
+# ============================================================================
+# COLUMNAR ANALYTICS
+# ============================================================================
+
+# The ad-hoc SQL the reports replace, run on the live database
+UTILIZATION_SQL = """
+    SELECT doctor_id,
+           SUM(status NOT IN ('Cancelled', 'Double-booked')),
+           SUM(CASE WHEN status NOT IN ('Cancelled', 'Double-booked') THEN COALESCE(duration, 15) ELSE 0 END),
+           SUM(status = 'Completed'), SUM(status = 'No-show')
+    FROM appointments WHERE date BETWEEN ? AND ? GROUP BY doctor_id
+"""
+REVENUE_SQL = """
+    SELECT COALESCE(d.specialization, 'Unattributed'), COUNT(*), SUM(b.total_paise), SUM(b.paid_paise)
+    FROM bills b
+    LEFT JOIN bill_items i ON i.bill_no = b.bill_no AND i.appointment_id IS NOT NULL
+    LEFT JOIN appointments a ON a.appointment_id = i.appointment_id
+    LEFT JOIN doctors d ON d.doctor_id = a.doctor_id
+    WHERE b.created_at >= ? AND b.created_at < ?
+    GROUP BY 1
+"""
+AGES_SQL = """
+    SELECT MIN(age / 10, 9), COUNT(*) FROM patients
+    WHERE age >= 0 AND id IN (SELECT p.id FROM appointments a JOIN patients p ON p.patient_id = a.patient_id
+                              WHERE a.date BETWEEN ? AND ? AND a.status NOT IN ('Cancelled', 'Double-booked'))
+    GROUP BY 1
+"""
+
+def _sql_reports(conn, start, end):
+    utilization = {row[0]: tuple(row[1:]) for row in conn.execute(UTILIZATION_SQL, (start, end))}
+    revenue = {row[0]: tuple(row[1:]) for row in conn.execute(REVENUE_SQL, (start, hospital._next_day(end)))}
+    ages = dict(conn.execute(AGES_SQL, (start, end)).fetchall())
+    return utilization, revenue, ages
+
+def _column_reports(reports, start, end):
+    utilization = {row['doctor_id']: (row['appointments'], row['booked_minutes'], row['completed'], row['no_shows'])
+                   for row in reports.doctor_utilization(start, end) if row['appointments'] or row['no_shows'] or row['completed']}
+    revenue = {row['specialization']: (row['bills'], row['billed_paise'], row['collected_paise'])
+               for row in reports.revenue_by_specialization(start, end)}
+    ages = {n: row['patients'] for n, row in enumerate(reports.age_distribution(10, start, end))
+            if row['ages'] != 'unknown' and row['patients']}
+    return utilization, revenue, ages
+
+def _export_contents(directory):
+    # Every exported value, text decoded (codes depend on the order values were first seen)
+    snapshot = hospital.ColumnarSnapshot(directory, use_numpy=False)
+    contents = {'rows': snapshot.manifest['rows'], 'marks': snapshot.manifest['marks'],
+                'doctors': snapshot.manifest['doctors']}
+    for table, (_, columns) in hospital.EXPORT_TABLES.items():
+        for column, _, dictionary in columns:
+            values = snapshot.column(table, column)
+            if dictionary:
+                values = [snapshot.dictionary(dictionary)[code] for code in values]
+            contents[table, column] = list(values)
+    return contents
+
+def bench_analytics(args):
+    anchor = datetime.date.today()
+    end = anchor - datetime.timedelta(days=1)
+    start = end - datetime.timedelta(days=args.days - 1)
+    with temp_system(sample_data=False) as system:
+        print_header("COLUMNAR ANALYTICS EXPORT")
+        generate_dataset(system, args.patients, args.seed, anchor)
+        db_path = system.db.conn.execute("PRAGMA database_list").fetchone()[2]
+        conn = system.db.conn
+        rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in hospital.EXPORT_TABLES)
+        print_row("Dataset:", f"{args.patients:,} patients, {rows:,} rows in {len(hospital.EXPORT_TABLES)} tables (seed {args.seed})")
+        
+        directory = db_path + hospital.ANALYTICS_SUFFIX
+        exporter = hospital.ColumnarExporter(db_path, directory)
+        result = exporter.export(full=True)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print_row("Full export:", f"{result['seconds']:.2f}s ({rows / result['seconds']:,.0f} rows/sec, "
+                  f"{size / 2**20:,.0f} MiB, database {os.path.getsize(db_path) / 2**20:,.0f} MiB)")
+        
+        # A day at the desks: registrations, check-ins and no-shows, payments
+        service = system.service
+        rnd = random.Random(args.seed)
+        for i in range(args.changes):
+            service.register_patient(patient_name(i), 30 + i % 50, "F", f"8{i:09d}")
+        scheduled = [row[0] for row in conn.execute(
+            "SELECT appointment_id FROM appointments WHERE status = 'Scheduled' LIMIT ?", (args.changes,))]
+        for appointment_id in scheduled:
+            service.transition(appointment_id, rnd.choice(['check_in', 'no_show', 'cancel']))
+        for (bill_no,) in conn.execute("SELECT bill_no FROM bills WHERE status != 'Paid' LIMIT ?", (args.changes,)).fetchall():
+            service.record_payment(bill_no, "1")
+        result = exporter.export()
+        print_row("Incremental export:", f"{result['seconds'] * 1000:.0f} ms (appended {sum(result['appended'].values()):,}, "
+                  f"updated {sum(result['updated'].values()):,} rows)")
+        incremental = _export_contents(directory)
+        exporter.export(full=True)
+        print_row("Same as a full export:", "✅" if incremental == _export_contents(directory) else "❌")
+        
+        print_header(f"REPORTS: {start} .. {end}")
+        timings = {}
+        with_numpy = hospital.ColumnarSnapshot(directory)
+        backends = [("SQL on the live database", lambda: _sql_reports(conn, start.isoformat(), end.isoformat()))]
+        if with_numpy.np is not None:
+            backends.append(("columns (numpy)", lambda: _column_reports(
+                hospital.AnalyticsReports(hospital.ColumnarSnapshot(directory)), start, end)))
+        else:
+            print_row("numpy:", "not installed; vectorized timings skipped")
+        backends.append(("columns (pure Python)", lambda: _column_reports(
+            hospital.AnalyticsReports(hospital.ColumnarSnapshot(directory, use_numpy=False)), start, end)))
+        print(f"\n{'backend':26} | {'all three ms':>12} | {'same answers':>12}")
+        print("-"*58)
+        baseline = None
+        for label, run in backends:
+            samples = []
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                answer = run()
+                samples.append((time.perf_counter() - t0) * 1000)
+            baseline = baseline or answer
+            timings[label] = statistics.median(samples)
+            print(f"{label:26} | {timings[label]:>12,.0f} | {'✅' if answer == baseline else '❌':>12}")
+        print("-"*58)
+        print_row("Columns include loading:", "each run reads the column files afresh")
+
+# ============================================================================
+# CHANGE LOG
+# ============================================================================
+
+def _fill_change_log(conn, count, rows, days):
+    # Synthetic history: `count` patient updates spread over the last `days` days,
+    # in place of the entries so far (the log is in time order)
+    conn.execute("DELETE FROM change_log")
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO change_log (table_name, op, row_id, row_key, data, actor, changed_at)
+        SELECT 'patients', 'update', 1 + abs(random()) % ?, NULL, '{}', 'bench',
+               strftime('%Y-%m-%d %H:%M:%f', 'now', printf('-%d seconds', (? - i) * ? / ?))
+        FROM n
+    ''', (count, rows, count, days * 86400, count))
+    conn.commit()
+
+def bench_changes(args):
+    anchor = datetime.date.today()
+    print_header("CHANGE LOG: WRITE OVERHEAD")
+    print_row("Commands:", f"{args.count:,} scripted commands, one transaction each")
+    print_row("Dataset:", f"{args.patients:,} patients (generated, seed {args.seed})")
+    print(f"\n{'change log':12} | {'ops/sec':>9} | {'entries':>9}")
+    print("-"*38)
+    rates = {}
+    for logged in (False, True):
+        with temp_system(sample_data=False) as system:
+            generate_dataset(system, args.patients, args.seed, anchor)
+            conn = system.db.conn
+            if not logged:
+                for (name,) in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_change\\_%' ESCAPE '\\'"
+                ).fetchall():
+                    conn.execute(f"DROP TRIGGER {name}")
+                conn.commit()
+            lines = _night_job(system, anchor, args.count, random.Random(args.seed))
+            before = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+            summary = hospital.BatchRunner(system.service, 1).run(lines, lambda line: None)
+            entries = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] - before
+            rates[logged] = summary['ops_per_sec']
+            print(f"{'on' if logged else 'off':12} | {summary['ops_per_sec']:>9,.0f} | {entries:>9,}")
+    print("-"*38)
+    print_row("Overhead:", f"{(rates[False] / rates[True] - 1) * 100:+.1f}% time per command")
+    
+    print_header("CHANGE LOG: TAILING AND COMPACTION")
+    print(f"\n{'log entries':>11} | {'caught-up poll ms':>17} | {'100 new ms':>10} | {'compact s':>9} | {'retention s':>11} | {'left':>9}")
+    print("-"*84)
+    for size in args.log_sizes:
+        with temp_system(sample_data=False) as system:
+            generate_dataset(system, args.patients, args.seed, anchor)
+            conn, service = system.db.conn, system.service
+            _fill_change_log(conn, size, args.patients, args.days)
+            last = conn.execute("SELECT MAX(seq) FROM change_log").fetchone()[0]
+            idle = []
+            for _ in range(args.polls):
+                t0 = time.perf_counter()
+                service.changes(last)
+                idle.append((time.perf_counter() - t0) * 1000)
+            fresh = []
+            for _ in range(args.polls):
+                t0 = time.perf_counter()
+                page = service.changes(last - 100)
+                fresh.append((time.perf_counter() - t0) * 1000)
+            assert len(page['changes']) == 100
+            t0 = time.perf_counter()
+            service.compact_changes(keep_days=None, compact_days=args.compact_days)
+            compact = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            service.compact_changes(keep_days=args.keep_days, compact_days=None)
+            retention = time.perf_counter() - t0
+            left = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+            print(f"{size:>11,} | {percentiles(idle)[50]:>17.3f} | {percentiles(fresh)[50]:>10.3f} | "
+                  f"{compact:>9.2f} | {retention:>11.2f} | {left:>9,}")
+    print("-"*84)
+    print_row("History:", f"{args.days} days; compact after {args.compact_days}, keep {args.keep_days}")
+
+# ============================================================================
+# ONLINE BACKUP
+# ============================================================================
+
+def _desk_writer(db_path, interval, ready, stop, queue):
+    # A desk registering a patient every `interval` seconds; reports each commit's latency
+    db = hospital.SimpleHospitalDB(db_path)
+    service = hospital.HospitalService(db, hospital.IdAllocator(db))
+    latencies, errors, i = [], 0, 0
+    ready.set()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            service.register_patient(patient_name(i), 30, 'F', f"8{i:09d}", "Backup Road")
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+        i += 1
+        time.sleep(interval)
+    queue.put((latencies, errors))
+    db.close()
+
+@contextlib.contextmanager
+def _desk_running(db_path, interval):
+    ready, stop, queue = multiprocessing.Event(), multiprocessing.Event(), multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_desk_writer, args=(db_path, interval, ready, stop, queue))
+    proc.start()
+    ready.wait()
+    time.sleep(0.2)
+    result = {}
+    try:
+        yield result
+    finally:
+        stop.set()
+        result['latencies'], result['errors'] = queue.get()
+        proc.join()
+
+def _pad_database(conn, megabytes):
+    # Bulk to reach a realistic file size: the backup copies pages, whatever is in them
+    conn.execute("CREATE TABLE bench_padding (id INTEGER PRIMARY KEY, filler BLOB)")
+    rows = megabytes * 256   # about 4 KB a row
+    for first in range(0, rows, 10_000):
+        conn.execute('''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO bench_padding (filler) SELECT randomblob(4000) FROM n
+        ''', (min(10_000, rows - first),))
+        conn.commit()
+
+def bench_backup(args):
+    anchor = datetime.date.today()
+    with temp_system(sample_data=False) as system:
+        generate_dataset(system, args.patients, args.seed, anchor)
+        if args.pad_mb:
+            _pad_database(system.db.conn, args.pad_mb)
+        db_path = system.db.path
+        system.db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(db_path)
+        directory = db_path + hospital.BACKUP_SUFFIX
+        
+        print_header("ONLINE BACKUP WHILE A DESK WRITES")
+        print_row("Database:", f"{size / 1e9:.2f} GB ({args.patients:,} patients"
+                  + (f" + {args.pad_mb:,} MB padding)" if args.pad_mb else ")"))
+        print_row("Desk:", f"one registration every {args.interval * 1000:.0f} ms, in another process")
+        print(f"\n{'backup':24} | {'seconds':>7} | {'MB/s':>6} | {'writes':>6} | {'p50 ms':>6} | {'p99 ms':>7} | "
+              f"{'max ms':>7} | {'errors':>6}")
+        print("-"*90)
+        
+        def row(label, seconds, desk):
+            pct = percentiles(desk['latencies'], (50, 99))
+            rate = f"{size / 1e6 / seconds:>6,.0f}" if seconds else f"{'':>6}"
+            print(f"{label:24} | {seconds:>7.2f} | {rate} | {len(desk['latencies']):>6,} | {pct[50]:>6.2f} | "
+                  f"{pct[99]:>7.2f} | {max(desk['latencies']):>7.2f} | {desk['errors']:>6,}")
+        
+        def next_second():
+            # Snapshots are named to the second: two in the same one would collide
+            time.sleep(1 - time.time() % 1)
+        
+        with _desk_running(db_path, args.interval) as desk:
+            time.sleep(args.baseline)
+        row("none (desk alone)", 0, desk)
+        for pages in args.pages:
+            manager = hospital.BackupManager(db_path, directory, keep=1, pages=pages, pause=args.pause)
+            next_second()
+            with _desk_running(db_path, args.interval) as desk:
+                result = manager.snapshot()
+            row(f"{pages if pages > 0 else 'all'} pages/step", result['seconds'], desk)
+        manager = hospital.BackupManager(db_path, directory, keep=1, pause=args.pause)
+        next_second()
+        with _desk_running(db_path, args.interval) as desk:
+            t0 = time.perf_counter()
+            result = manager.snapshot(compress=True)
+            compressed = time.perf_counter() - t0
+        row(f"{hospital.BACKUP_PAGES} + gzip", compressed, desk)
+        print("-"*90)
+        print_row("Compressed size:", f"{result['compressed_bytes'] / 1e6:,.0f} MB "
+                  f"({result['compressed_bytes'] / result['bytes'] * 100:.0f}% of {result['bytes'] / 1e6:,.0f} MB)")
+        
+        t0 = time.perf_counter()
+        check = manager.verify(result['path'])
+        print_row("Verify (gunzip + integrity):", f"{time.perf_counter() - t0:.2f}s {'✅' if check['ok'] else '❌'}")
+        with _desk_running(db_path, args.interval) as desk:
+            restored = manager.restore(result['path'])
+        print_row("Restore into the live file:", f"{restored['seconds']:.2f}s; the desk waited up to "
+                  f"{max(desk['latencies']):,.0f} ms, {desk['errors']} write(s) failed")
+
+# ============================================================================
+# MEDICAL RECORDS
+# ============================================================================
+
+def _fill_encounters(conn, count, start, patient_id, patients, days):
+    # `count` visits (two diagnoses and a prescription each) spread over the
+    # last `days` days: all for patient_id, or for random patients if it is None
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO encounters (encounter_id, patient_id, doctor_id, recorded_at, notes)
+        SELECT printf('ENC%08d', ? + i), COALESCE(?, printf('P%08d', 1 + abs(random()) % ?)), 'DOC001',
+               datetime('now', 'localtime', printf('-%d seconds', i * ? / ?)),
+               'Follow-up: stable on current treatment, review in four weeks.'
+        FROM n
+    ''', (count, start, patient_id, patients, days * 86400, count))
+    for code, description in (('J45.9', 'Asthma, unspecified'), ('E11.9', 'Type 2 diabetes without complications')):
+        conn.execute("INSERT INTO diagnoses (encounter_id, code, description) "
+                     "SELECT encounter_id, ?, ? FROM encounters WHERE id > ?", (code, description, start))
+    conn.execute("INSERT INTO prescriptions (encounter_id, medicine, dose, frequency, days) "
+                 "SELECT encounter_id, 'Paracetamol', '500mg', 'TDS', 5 FROM encounters WHERE id > ?", (start,))
+    conn.commit()
+
+def _round_trip_history(service, conn, patient_id):
+    # What a client does without timeline(): list the visits, then one call per visit
+    encounters = [row[0] for row in conn.execute(
+        "SELECT encounter_id FROM encounters WHERE patient_id = ? ORDER BY recorded_at DESC", (patient_id,))]
+    entries = [service.encounter_details(encounter_id) for encounter_id in encounters]
+    entries += conn.execute("SELECT * FROM appointments WHERE patient_id = ?", (patient_id,)).fetchall()
+    entries += conn.execute("SELECT * FROM bills WHERE patient_id = ?", (patient_id,)).fetchall()
+    return entries
+
+def bench_records(args):
+    anchor = datetime.date.today()
+    print_header("MEDICAL RECORDS: PATIENT TIMELINE")
+    print_row("Dataset:", f"{args.patients:,} patients (generated, seed {args.seed}) + {args.background:,} visits "
+                          f"spread over them")
+    print(f"\n{'visits':>7} | {'entries':>7} | {'timeline ms':>11} | {'per-visit calls ms':>18} | "
+          f"{'page 50 ms':>10} | {'last page ms':>12}")
+    print("-"*84)
+    with temp_system(sample_data=False) as system:
+        generate_dataset(system, args.patients, args.seed, anchor)
+        conn, service = system.db.conn, system.service
+        _fill_encounters(conn, args.background, 0, None, args.patients, args.days)
+        start = args.background
+        # Heavy patients: the same patient seen more and more often
+        for n, visits in enumerate(args.visits, 2):
+            patient_id = hospital.format_id("P", n)
+            _fill_encounters(conn, visits, start, patient_id, args.patients, args.days)
+            start += visits
+            
+            def timed(fn):
+                times = []
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    result = fn()
+                    times.append((time.perf_counter() - t0) * 1000)
+                return result, percentiles(times, (50,))[50]
+            
+            history, full = timed(lambda: service.timeline(patient_id))
+            entries = history['entries']
+            _, calls = timed(lambda: _round_trip_history(service, conn, patient_id))
+            first, page = timed(lambda: service.timeline(patient_id, limit=50))
+            # The oldest page, reached the way a client pages: before = the previous page's last entry
+            before = f"{entries[-51]['at']}|{entries[-51]['ref']}"
+            last, deep = timed(lambda: service.timeline(patient_id, before=before, limit=50))
+            assert len(first['entries']) == 50 and len(last['entries']) == 50
+            assert last['entries'][-1]['ref'] == entries[-1]['ref']
+            print(f"{visits:>7,} | {len(entries):>7,} | {full:>11.1f} | {calls:>18.1f} | {page:>10.2f} | {deep:>12.2f}")
+        print("-"*84)
+        print_row("Timeline plan:", "")
+        for row in conn.execute("EXPLAIN QUERY PLAN " + hospital.TIMELINE_SQL, [None] * 16):
+            print(f"     {row[3]}")
+        
+        print_header("MEDICAL RECORDS: ATTACHMENTS")
+        encounter_id = hospital.format_id("ENC", start)
+        data = random.Random(args.seed).randbytes(args.attachment_mb * 1024 * 1024)
+        sink = open(os.devnull, 'wb')
+        print(f"\n{'operation':32} | {'seconds':>7} | {'MB/s':>7} | {'peak MB':>7}")
+        print("-"*64)
+        for label, fn in (
+            ("attach (new contents)", lambda: service.attach(encounter_id, "scan.dcm", data)),
+            ("attach (same contents again)", lambda: service.attach(encounter_id, "copy.dcm", data)),
+            ("read_attachment to a file", lambda: service.read_attachment(1, sink.write)),
+            ("attachment (base64 for JSON)", lambda: service.attachment(1)),
+        ):
+            _, elapsed, peak = _peak_memory(fn)
+            print(f"{label:32} | {elapsed:>7.3f} | {args.attachment_mb / elapsed:>7.0f} | {peak / 2**20:>7.1f}")
+        print("-"*64)
+        sink.close()
+        blobs = conn.execute("SELECT COUNT(*), COALESCE(SUM(length(data)), 0) FROM attachment_blobs").fetchone()
+        print_row("Stored:", f"{blobs[0]} blob(s), {blobs[1] / 2**20:.1f} MB for 2 attachments")
+
+# ============================================================================
+# STARTUP
+# ============================================================================
+
+STARTUP_TARGET_MS = 50
+MENU_PROMPT = b"Enter your choice"
+
+def _time_to_menu(cmd, cwd, env):
+    # Launch the interactive program, wait for the first menu prompt, then pick Exit
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    output = b""
+    while MENU_PROMPT not in output:
+        chunk = os.read(proc.stdout.fileno(), 65536)
+        if not chunk:
+            proc.wait()
+            raise RuntimeError(f"{' '.join(cmd)} exited before showing the menu:\n{output.decode(errors='replace')}")
+        output += chunk
+    elapsed = (time.perf_counter() - start) * 1000
+    proc.communicate(b"7\n", timeout=30)
+    return elapsed
+
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, "hospital.py")
+    print_header("STARTUP: LAUNCH TO FIRST MENU")
+    print_row("Runs per case:", f"{args.runs} (after one warm-up run)")
+    print_row("Target:", f"< {STARTUP_TARGET_MS} ms")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "hospital.db")
+        # Bytecode caching on, as on a desk where the program has run before
+        env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+        env["HOSPITAL_DB"] = db_path
+        # (label, command, cwd, runs the menu)
+        cases = [
+            ("python -c pass (floor)", [sys.executable, "-c", "pass"], None, False),
+            ("import hospital", [sys.executable, "-c", "import hospital"], here, False),
+            ("python hospital.py", [sys.executable, script], None, True),
+            ("python -m hospital", [sys.executable, "-m", "hospital"], here, True),
+        ]
+        print(f"\n{'launch':28} | {'p50 ms':>8} | {'min ms':>8}")
+        print("-"*52)
+        for label, cmd, cwd, menu in cases:
+            def run():
+                if menu:
+                    return _time_to_menu(cmd, cwd, env)
+                start = time.perf_counter()
+                subprocess.run(cmd, cwd=cwd, env=env, check=True)
+                return (time.perf_counter() - start) * 1000
+            run()
+            times = [run() for _ in range(args.runs)]
+            p50 = percentiles(times, (50,))[50]
+            flag = (" ✅" if p50 < STARTUP_TARGET_MS else " ⚠️") if menu else ""
+            print(f"{label:28} | {p50:8.1f} | {min(times):8.1f}{flag}")
+        print("-"*52)
+        
+        # In-process cost of opening an up-to-date database
+        with contextlib.redirect_stdout(io.StringIO()):
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                system = hospital.SimpleHospitalSystem(db_path=db_path)
+                times.append((time.perf_counter() - start) * 1000)
+                system.close()
+        print_row("SimpleHospitalSystem() open:", f"{percentiles(times, (50,))[50]:.2f} ms p50")
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+# ============================================================================
+# BENCHMARK SUITE (machine-readable results for comparing commits)
+# ============================================================================
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _measure(fn, count, budget):
+    # At most `count` calls or `budget` seconds, whichever comes first (at least 5 calls)
+    samples = []
+    deadline = time.perf_counter() + budget
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+        if i >= 4 and time.perf_counter() > deadline:
+            break
+    pct = percentiles(samples)
+    return {
+        'calls': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p50_ms': round(pct[50], 4),
+        'p95_ms': round(pct[95], 4),
+        'p99_ms': round(pct[99], 4),
+        'ops_per_sec': round(len(samples) / (sum(samples) / 1000), 1),
+    }
+
+def _suite_operations(system, anchor, rnd, count):
+    """(name, fn(i)) for every service operation, in a fixed order; writes come after the reads they would disturb"""
+    service = system.service
+    cursor = system.db.conn.cursor()
+    patient_total = cursor.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+    patient_ids = [hospital.format_id("P", 1 + int(patient_total * rnd.random() ** 1.5)) for _ in range(count)]
+    doctors = [row[0] for row in cursor.execute("SELECT doctor_id FROM doctors ORDER BY id").fetchall()]
+    names = [row[0] for row in cursor.execute("SELECT name FROM patients WHERE id % 997 = 0 LIMIT 500").fetchall()]
+    medicines = [row[0] for row in cursor.execute("SELECT DISTINCT name FROM medicines ORDER BY name").fetchall()]
+    pending = [row[0] for row in cursor.execute(
+        "SELECT bill_no FROM bills WHERE status IN ('Pending', 'Partial') ORDER BY id DESC LIMIT ?", (count,)).fetchall()]
+    specializations = [row[0] for row in cursor.execute("SELECT DISTINCT specialization FROM doctors ORDER BY 1").fetchall()]
+    tomorrow = anchor + datetime.timedelta(days=1)
+    busy_day = anchor - datetime.timedelta(days=anchor.weekday() + 7)   # Monday of last week
+    month_start, year_start = anchor.replace(day=1), anchor.replace(month=1, day=1)
+    slots = iter(service.next_free_slots(from_date=tomorrow, count=count))
+    
+    def pick(items, i):
+        return items[i % len(items)]
+    
+    def book(i):
+        date, time_, doctor_id = next(slots)
+        service.book(pick(patient_ids, i), doctor_id, date, time_)
+    
+    return [
+        ("get_patient", lambda i: service.get_patient(pick(patient_ids, i))),
+        ("search_name_prefix", lambda i: service.search_patients(pick(names, i).split()[0][:4])),
+        ("search_full_name", lambda i: service.search_patients(pick(names, i))),
+        ("search_fuzzy", lambda i: service.search_patients(_misspell(pick(names, i)), fuzzy=True)),
+        ("search_phone", lambda i: service.search_patients(f"9{i % 1000:03d}")),
+        ("search_patient_id", lambda i: service.search_patients(pick(patient_ids, i)[:7])),
+        ("list_patients_page", lambda i: list(itertools.islice(service.iter_patients(), hospital.PAGE_SIZE))),
+        ("list_doctors", lambda i: service.list_doctors()),
+        ("get_doctor", lambda i: service.get_doctor(pick(doctors, i))),
+        ("free_slots", lambda i: service.free_slots(pick(doctors, i), tomorrow, 10)),
+        ("next_free_slots", lambda i: service.next_free_slots(pick(specializations, i), tomorrow, 10)),
+        ("appointments_on", lambda i: service.appointments_on(busy_day)),
+        ("list_medicines", lambda i: service.list_medicines()),
+        ("low_stock", lambda i: service.low_stock()),
+        ("expiring_stock", lambda i: service.expiring_stock(30)),
+        ("pending_charges", lambda i: service.pending_charges(pick(patient_ids, i))),
+        ("bill_details", lambda i: service.bill_details(pick(pending, i))),
+        ("statistics", lambda i: service.statistics()),
+        ("statistics_exact", lambda i: service.statistics(exact=True)),
+        ("daily_report", lambda i: service.daily_report(busy_day)),
+        ("financial_report_mtd", lambda i: service.financial_report(month_start, anchor)),
+        ("period_report_ytd", lambda i: service.period_report('ytd', anchor)),
+        ("register_patient", lambda i: service.register_patient(patient_name(i), 30, "F", f"7{i:09d}", "Desk")),
+        ("book", book),
+        ("add_medicine", lambda i: service.add_medicine(pick(medicines, i), 100, 12.5,
+                                                         (anchor + datetime.timedelta(days=400)).isoformat())),
+        ("dispense", lambda i: service.dispense(pick(medicines, i), 1, "suite", pick(patient_ids, i))),
+        ("create_bill", lambda i: service.create_bill(pick(patient_ids, i), [("Dressing", 1, 150)])),
+        ("record_payment", lambda i: service.record_payment(pick(pending, i), "1")),
+    ]
+
+def bench_suite(args):
+    anchor = datetime.date.fromisoformat(args.anchor) if args.anchor else datetime.date.today()
+    print_header("BENCHMARK SUITE")
+    print_row("Dataset:", f"{args.patients:,} patients, seed {args.seed}, anchor {anchor}")
+    
+    with temp_system(sample_data=False) as system:
+        start = time.perf_counter()
+        counts = generate_dataset(system, args.patients, args.seed, anchor, args.days, args.visits)
+        generate_seconds = time.perf_counter() - start
+        rows = sum(counts.values())
+        print_row("Generated:", f"{rows:,} rows in {generate_seconds:.1f}s ({rows / generate_seconds:,.0f} rows/sec)")
+        
+        # One-off jobs first: they change what the timed operations see
+        jobs = {}
+        for name, fn in [("close_days", lambda: system.service.close_days(anchor)),
+                         ("invoice_day", lambda: system.service.invoice_day(anchor))]:
+            start = time.perf_counter()
+            fn()
+            jobs[name] = {'seconds': round(time.perf_counter() - start, 4)}
+        
+        rnd = random.Random(args.seed)
+        results = {}
+        print(f"\n{'operation':24} | {'calls':>6} | {'p50 ms':>8} | {'p99 ms':>8} | {'ops/sec':>10}")
+        print("-"*70)
+        for name, fn in _suite_operations(system, anchor, rnd, args.count):
+            if args.only and name not in args.only:
+                continue
+            result = results[name] = _measure(fn, args.count, args.budget)
+            print(f"{name:24} | {result['calls']:>6} | {result['p50_ms']:>8.3f} | {result['p99_ms']:>8.3f} | "
+                  f"{result['ops_per_sec']:>10,.0f}")
+        print("-"*70)
+        for name, job in jobs.items():
+            print_row(f"{name}:", f"{job['seconds'] * 1000:.1f} ms")
+    
+    report = {
+        'suite': 'hospital',
+        'version': 1,
+        'meta': {
+            'commit': _git_commit(),
+            'run_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'schema_version': hospital.SCHEMA_VERSION,
+        },
+        'dataset': {
+            'patients': args.patients, 'seed': args.seed, 'anchor': anchor.isoformat(), 'days': args.days,
+            'visits': args.visits, 'rows': counts, 'generate_seconds': round(generate_seconds, 3),
+        },
+        'params': {'count': args.count, 'budget': args.budget},
+        'results': results,
+        'jobs': jobs,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print_row("Results written to:", args.json)
+    return report
+
+def bench_compare(args):
+    """Compare two suite result files; exit 1 if any operation's p50 regressed past the threshold"""
+    with open(args.baseline, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        new = json.load(f)
+    print_header("SUITE COMPARISON")
+    print_row("Baseline:", f"{old['meta'].get('commit')} ({old['meta']['run_at']})")
+    print_row("Current:", f"{new['meta'].get('commit')} ({new['meta']['run_at']})")
+    if old['dataset']['patients'] != new['dataset']['patients'] or old['dataset']['seed'] != new['dataset']['seed']:
+        print("⚠️  The runs used different datasets; differences may not be regressions")
+    
+    print(f"\n{'operation':24} | {'base p50':>9} | {'now p50':>9} | {'change':>8}")
+    print("-"*60)
+    regressions = []
+    for name in sorted(set(old['results']) | set(new['results'])):
+        before, after = old['results'].get(name), new['results'].get(name)
+        if before is None or after is None:
+            print(f"{name:24} | {'-' if before is None else before['p50_ms']:>9} | "
+                  f"{'-' if after is None else after['p50_ms']:>9} |")
+            continue
+        change = (after['p50_ms'] / before['p50_ms'] - 1) * 100 if before['p50_ms'] else 0.0
+        flag = ""
+        if change > args.threshold:
+            regressions.append(name)
+            flag = " ❌"
+        elif change < -args.threshold:
+            flag = " ✅"
+        print(f"{name:24} | {before['p50_ms']:>9.3f} | {after['p50_ms']:>9.3f} | {change:>+7.1f}%{flag}")
+    print("-"*60)
+    print_row("Regressions:", ", ".join(regressions) if regressions else "none")
+    return 1 if regressions else 0
+
+def bench_generate(args):
+    """Write a generated dataset to a database file, e.g. for load tests"""
+    if os.path.exists(args.path):
+        print(f"❌ {args.path} already exists")
+        return 1
+    anchor = datetime.date.fromisoformat(args.anchor) if args.anchor else datetime.date.today()
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = hospital.SimpleHospitalSystem(db_path=args.path)
+    
+    def progress(stage, done):
+        if done:
+            print(f"  {stage}: {done:,}", flush=True)
+    
+    start = time.perf_counter()
+    try:
+        counts = generate_dataset(system, args.patients, args.seed, anchor, args.days, args.visits, progress)
+    finally:
+        system.close()
+    elapsed = time.perf_counter() - start
+    print_header(f"GENERATED {args.path}")
+    for table, rows in counts.items():
+        print_row(f"{table}:", f"{rows:,}")
+    print_row("Time:", f"{elapsed:.1f}s ({sum(counts.values()) / elapsed:,.0f} rows/sec)")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Hospital management system benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    
+    p = sub.add_parser("ids", help="ID allocation with many concurrent writers")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--count", type=int, default=500, help="IDs allocated by each writer")
+    p.add_argument("--block-size", type=int, default=64)
+    p.add_argument("--think-ms", type=float, default=1.0, help="form-entry time simulated per ID")
+    p.set_defaults(func=bench_ids)
+    
+    p = sub.add_parser("patients", help="memory of listing patients, fetchall vs streaming")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    p.set_defaults(func=bench_patients)
+    
+    p = sub.add_parser("models", help="memory and time per row: tuples, typed rows, sqlite3.Row, dataclasses, dicts")
+    p.add_argument("--rows", type=int, default=200_000)
+    p.add_argument("--repeat", type=int, default=7)
+    p.set_defaults(func=bench_models)
+    
+    p = sub.add_parser("search", help="patient search latency percentiles")
+    p.add_argument("--patients", type=int, default=100_000, help="use 1000000 for the 1M target")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_search)
+    
+    p = sub.add_parser("db", help="mixed read/write throughput, old vs tuned connection settings")
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--patients", type=int, default=20_000)
+    p.add_argument("--read-ratio", type=float, default=0.9)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.set_defaults(func=bench_db)
+    
+    p = sub.add_parser("service", help="operations/sec through HospitalService")
+    p.add_argument("--count", type=int, default=2000)
+    p.add_argument("--patients", type=int, default=10_000)
+    p.set_defaults(func=bench_service)
+    
+    p = sub.add_parser("stats", help="dashboard latency, full aggregates vs maintained counters")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(func=bench_stats)
+    
+    p = sub.add_parser("pharmacy", help="FEFO dispensing throughput with concurrent counters")
+    p.add_argument("--medicines", type=int, default=2000)
+    p.add_argument("--batches", type=int, default=20, help="batches per medicine")
+    p.add_argument("--batch-units", type=int, default=20)
+    p.add_argument("--counters", type=int, default=8, help="processes dispensing at once")
+    p.add_argument("--count", type=int, default=1000, help="dispenses per counter")
+    p.set_defaults(func=bench_pharmacy)
+    
+    p = sub.add_parser("cache", help="patient/doctor lookup latency with the lookup cache off and on")
+    p.add_argument("--patients", type=int, default=100_000)
+    p.add_argument("--doctors", type=int, default=200)
+    p.add_argument("--hot", type=int, default=2000, help="distinct patients looked up")
+    p.add_argument("--count", type=int, default=20_000)
+    p.add_argument("--write-every", type=int, default=0, help="commit on another connection every N lookups")
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_cache)
+    
+    p = sub.add_parser("metrics", help="service throughput with query instrumentation off and on")
+    p.add_argument("--patients", type=int, default=20_000)
+    p.add_argument("--count", type=int, default=1000)
+    p.add_argument("--rounds", type=int, default=9)
+    p.add_argument("--sample", type=int, default=hospital.METRICS_SAMPLE_EVERY, help="sampling rate of the third side")
+    p.set_defaults(func=bench_metrics)
+    
+    p = sub.add_parser("billing", help="end-of-day batch invoicing vs one bill per transaction")
+    p.add_argument("--patients", type=int, default=5000)
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 500, 5000])
+    p.set_defaults(func=bench_billing)
+    
+    p = sub.add_parser("reports", help="financial report latency, raw bills vs daily rollups")
+    p.add_argument("--years", type=int, default=3)
+    p.add_argument("--per-day", type=int, default=1000, help="bills created per day")
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_reports)
+    
+    p = sub.add_parser("import", help="bulk CSV import throughput and memory")
+    p.add_argument("--rows", type=int, default=200_000, help="use 1000000 for the 1M target")
+    p.add_argument("--batch-size", type=int, default=hospital.IMPORT_BATCH_SIZE)
+    p.set_defaults(func=bench_import)
+    
+    p = sub.add_parser("api", help="load test the HTTP API with many concurrent clients")
+    p.add_argument("--clients", type=int, default=200)
+    p.add_argument("--requests", type=int, default=50, help="requests per client")
+    p.add_argument("--workers", type=int, default=hospital.API_WORKERS)
+    p.add_argument("--patients", type=int, default=10_000)
+    p.set_defaults(func=bench_api)
+    
+    p = sub.add_parser("schedule", help="slot conflict checks, free-slot search and a double-booking race")
+    p.add_argument("--doctors", type=int, default=100)
+    p.add_argument("--days", type=int, default=90, help="days of appointments to seed")
+    p.add_argument("--fill", type=float, default=0.9, help="share of slots already booked")
+    p.add_argument("--queries", type=int, default=2000)
+    p.add_argument("--desks", type=int, default=8, help="processes racing for the same slots")
+    p.add_argument("--race-slots", type=int, default=50)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_schedule)
+    
+    p = sub.add_parser("agenda", help="date-range agendas and appointment status transitions on a generated dataset")
+    p.add_argument("--patients", type=int, default=50_000)
+    p.add_argument("--days", type=int, default=90, help="agenda range, ending today")
+    p.add_argument("--count", type=int, default=1000, help="single transitions to time")
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_agenda)
+    
+    p = sub.add_parser("batch", help="scripted JSON commands at different transaction batch sizes")
+    p.add_argument("--count", type=int, default=20_000)
+    p.add_argument("--patients", type=int, default=20_000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 1000])
+    p.set_defaults(func=bench_batch)
+    
+    p = sub.add_parser("shards", help="per-branch databases: concurrent writes and federated reports")
+    p.add_argument("--workers", type=int, default=4, help="writer processes (one branch each when sharded)")
+    p.add_argument("--count", type=int, default=2000, help="registrations per writer")
+    p.add_argument("--branches", type=int, default=4)
+    p.add_argument("--patients", type=int, default=20_000, help="generated patients per branch")
+    p.add_argument("--processes", type=int, help="report worker processes (default: one per branch, up to the CPU count)")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_shards)
+    
+    p = sub.add_parser("analytics", help="columnar export (full and incremental) and reports against the SQL they replace")
+    p.add_argument("--patients", type=int, default=200_000, help="about 10 exported rows per patient")
+    p.add_argument("--days", type=int, default=90, help="report range, ending yesterday")
+    p.add_argument("--changes", type=int, default=1000, help="registrations, transitions and payments before the incremental export")
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_analytics)
+    
+    p = sub.add_parser("changes", help="change log write overhead, tail latency by log size, compaction")
+    p.add_argument("--count", type=int, default=5000)
+    p.add_argument("--patients", type=int, default=20_000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--log-sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    p.add_argument("--polls", type=int, default=200)
+    p.add_argument("--days", type=int, default=120, help="how far back the synthetic history goes")
+    p.add_argument("--compact-days", type=int, default=hospital.CHANGE_LOG_COMPACT_DAYS)
+    p.add_argument("--keep-days", type=int, default=hospital.CHANGE_LOG_KEEP_DAYS)
+    p.set_defaults(func=bench_changes)
+    
+    p = sub.add_parser("backup", help="online snapshot duration and desk write latency while it runs")
+    p.add_argument("--patients", type=int, default=20_000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--pad-mb", type=int, default=0, help="add this much bulk to test multi-GB files")
+    p.add_argument("--pages", type=int, nargs="+", default=[256, hospital.BACKUP_PAGES, -1],
+                   help="pages per step to compare (-1: all at once)")
+    p.add_argument("--pause", type=float, default=hospital.BACKUP_PAUSE)
+    p.add_argument("--interval", type=float, default=0.005, help="seconds between the desk's writes")
+    p.add_argument("--baseline", type=float, default=3.0, help="seconds the desk writes alone")
+    p.set_defaults(func=bench_backup)
+    
+    p = sub.add_parser("records", help="patient timeline latency by visit count, and attachment I/O")
+    p.add_argument("--patients", type=int, default=20_000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--background", type=int, default=100_000, help="visits spread over all patients")
+    p.add_argument("--visits", type=int, nargs="+", default=[100, 1000, 5000],
+                   help="visits of each heavy patient to time")
+    p.add_argument("--days", type=int, default=3650, help="how far back the visits go")
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--attachment-mb", type=int, default=20)
+    p.set_defaults(func=bench_records)
+    
+    p = sub.add_parser("startup", help="time from launching hospital.py to its first menu")
+    p.add_argument("--runs", type=int, default=20)
+    p.set_defaults(func=bench_startup)
+    
+    p = sub.add_parser("generate", help="write a seeded synthetic dataset to a database file")
+    p.add_argument("path")
+    p.add_argument("--patients", type=int, default=100_000, help="10000 to 10000000")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--anchor", help="YYYY-MM-DD the history ends on (default today)")
+    p.add_argument("--days", type=int, default=365, help="days of appointment history")
+    p.add_argument("--visits", type=float, default=2.0, help="appointments per patient over the history")
+    p.set_defaults(func=bench_generate)
+    
+    p = sub.add_parser("suite", help="time every service operation on a generated dataset; --json for comparisons")
+    p.add_argument("--patients", type=int, default=100_000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--anchor", help="YYYY-MM-DD the history ends on (default today)")
+    p.add_argument("--days", type=int, default=365)
+    p.add_argument("--visits", type=float, default=2.0)
+    p.add_argument("--count", type=int, default=500, help="calls per operation")
+    p.add_argument("--budget", type=float, default=2.0, help="seconds per operation at most")
+    p.add_argument("--only", nargs="+", help="operations to run")
+    p.add_argument("--json", help="write machine-readable results here")
+    p.set_defaults(func=bench_suite)
+    
+    p = sub.add_parser("compare", help="compare two suite --json results; exits 1 on a regression")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=10.0, help="percent p50 slowdown that counts as a regression")
+    p.set_defaults(func=bench_compare)
+    
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    result = args.func(args)
+    return result if isinstance(result, int) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
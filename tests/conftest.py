@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# hospital_core.py sits at the top of the repository, not in an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hospital_core
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A freshly migrated database in a temporary directory"""
+    db = hospital_core.SimpleHospitalDB(str(tmp_path / "hospital.db"))
+    yield db
+    db.close()
@@ -0,0 +1,49 @@
+import datetime
+
+import hospital_core
+
+
+def _decoded(directory):
+    snapshot = hospital_core.ColumnarSnapshot(directory, use_numpy=False)
+    tables = {}
+    for table in hospital_core.EXPORT_TABLES:
+        columns = {}
+        for column, (_, dictionary) in hospital_core._export_columns(table).items():
+            values = list(snapshot.column(table, column))
+            # Codes are handed out in the order values were met: compare the values
+            columns[column] = [snapshot.dictionary(dictionary)[code] for code in values] if dictionary else values
+        tables[table] = columns
+    return tables
+
+
+def test_incremental_export_equals_a_full_export(db, tmp_path):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    db.conn.execute("INSERT INTO doctors (doctor_id, name, specialization, fee_paise, phone) "
+                    "VALUES ('DOC001', 'Dr. Rao', 'Cardiology', 50000, '')")
+    patients = [service.register_patient(f"Patient {i}", 20 + i, "MF"[i % 2], "9123456789") for i in range(3)]
+    
+    def visit(appointment_id, patient_id, time):
+        db.conn.execute("INSERT INTO appointments (appointment_id, patient_id, doctor_id, date, time, status) "
+                        "VALUES (?, ?, 'DOC001', ?, ?, 'Scheduled')", (appointment_id, patient_id, yesterday, time))
+        db.conn.commit()
+    
+    incremental = hospital_core.ColumnarExporter(db.path, str(tmp_path / "incremental"))
+    for n, patient_id in enumerate(patients):
+        visit(f"APT{n}", patient_id, f"1{n}:00")
+    incremental.export()
+    
+    service.transition("APT0", "complete")
+    service.transition("APT1", "no_show")
+    bill_no = service.create_bill(patients[0])
+    assert incremental.export()['updated']['appointments'] == 2
+    
+    service.record_payment(bill_no, 200)
+    visit("APT3", service.register_patient("Late Patient", 61, "F", "9123456780"), "14:00")
+    service.transition("APT3", "complete")
+    service.create_bill(patients[2], [("Dressing", 1, 150)])
+    assert incremental.export()['updated']['bills'] == 1
+    
+    full = hospital_core.ColumnarExporter(db.path, str(tmp_path / "full"))
+    full.export(full=True)
+    assert _decoded(str(tmp_path / "incremental")) == _decoded(str(tmp_path / "full"))
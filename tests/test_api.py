@@ -0,0 +1,15 @@
+import hospital_core
+
+
+def test_internal_errors_are_not_sent_to_the_client(db, capsys):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    server = hospital_core.HospitalAPIServer(service, workers=1)
+    
+    def api_failing(service, params, query, body):
+        raise RuntimeError("UPDATE patients SET phone = '9123456789'")
+    
+    try:
+        assert server._call(api_failing, (), {}, None) == (500, {'error': 'Internal error'})
+    finally:
+        server.executor.shutdown()
+    assert "9123456789" in capsys.readouterr().err
@@ -0,0 +1,21 @@
+import hospital_core
+
+
+def test_restore_never_reissues_ids(tmp_path):
+    path = str(tmp_path / "hospital.db")
+    db = hospital_core.SimpleHospitalDB(path)
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    backups = hospital_core.BackupManager(path, str(tmp_path / "backups"))
+    snapshot = backups.snapshot(compress=True)['path']
+    issued = service.register_patient("Asha Rao", 35, "F", "9123456780")
+    seq = service.changes()['next']
+    
+    result = backups.restore(snapshot)
+    assert result['rows']['patients'] == 1
+    assert service.get_patient(issued) is None
+    assert service.register_patient("Uma Devi", 50, "F", "9123456781") > issued
+    changes = service.changes(seq)['changes']
+    assert changes[0]['seq'] > seq and changes[0]['op'] == 'restore'
+    service.ids.close()
+    db.close()
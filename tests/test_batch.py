@@ -0,0 +1,35 @@
+import json
+
+import hospital_core
+
+COMMANDS = [
+    '{"op": "register_patient", "id": 1, "name": "Ravi Kumar", "age": 40}',
+    '# comments and blank lines are skipped',
+    '',
+    '{"op": "register_patient", "id": 2, "name": "Asha Rao", "age": 35}',
+    '{"op": "register_patient", "id": 3, "name": "", "age": 30}',
+    '{"op": "register_patient", "id": 4, "name": "Meena Iyer", "age": 52}',
+]
+
+
+def _run(db, **kwargs):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    out = []
+    summary = hospital_core.BatchRunner(service, **kwargs).run(COMMANDS, out.append)
+    names = [row[0] for row in db.conn.execute("SELECT name FROM patients ORDER BY id")]
+    return summary, [json.loads(line) for line in out], names
+
+
+def test_stop_on_error_rolls_back_the_whole_batch(db):
+    summary, results, names = _run(db, batch_size=10, stop_on_error=True)
+    assert names == []
+    assert db.conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == 0
+    assert [(result['id'], result['ok']) for result in results] == [(1, False), (2, False), (3, False)]
+    assert summary['stopped'] and summary['ok'] == 0
+
+
+def test_a_refused_command_is_undone_on_its_own(db):
+    summary, results, names = _run(db, batch_size=2)
+    assert names == ["Ravi Kumar", "Asha Rao", "Meena Iyer"]
+    assert [result['ok'] for result in results] == [True, True, False, True]
+    assert (summary['batches'], summary['failed']) == (2, 1)
@@ -0,0 +1,40 @@
+import datetime
+
+import hospital_core
+
+
+def test_no_show_is_not_charged(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    db.conn.execute("INSERT INTO doctors (doctor_id, name, specialization, fee_paise, phone) "
+                    "VALUES ('DOC001', 'Dr. Rao', 'Cardiology', 50000, '')")
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    for appointment_id, time, status in (("APT001", "10:00", "Completed"), ("APT002", "11:00", "No-show")):
+        db.conn.execute("INSERT INTO appointments (appointment_id, patient_id, doctor_id, date, time, status) "
+                        "VALUES (?, ?, 'DOC001', ?, ?, ?)", (appointment_id, patient_id, yesterday, time, status))
+    db.conn.commit()
+    assert [charge[4] for charge in service.pending_charges(patient_id)] == ["APT001"]
+    assert service.invoice_day(yesterday)['bills'] == 1
+
+
+def test_financial_report_is_read_only_and_matches_closed_days(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    today = datetime.date.today()
+    days = [(today - datetime.timedelta(days=n)).isoformat() for n in (3, 2, 0)]
+    for n, day in enumerate(days, 1):
+        db.conn.execute("INSERT INTO bills (bill_no, patient_id, total_paise, paid_paise, status, created_at) "
+                        "VALUES (?, ?, ?, 0, 'Pending', ?)", (f"BILL{n:03d}", patient_id, n * 10000, day + " 10:00:00"))
+    db.conn.commit()
+    
+    open_report = service.financial_report(days[0], days[-1], by_day=True)
+    assert db.conn.execute("SELECT COUNT(*) FROM bill_day_rollups").fetchone()[0] == 0
+    assert not db.conn.in_transaction
+    assert open_report['bills'] == 3 and open_report['billed_paise'] == 60000
+    
+    service.record_payment("BILL001", 50)  # the first billing write of the day closes the earlier days
+    assert db.conn.execute("SELECT COUNT(*) FROM bill_day_rollups").fetchone()[0] == 3
+    closed_report = service.financial_report(days[0], days[-1], by_day=True)
+    assert closed_report == {**open_report, 'collected_paise': 5000, 'outstanding_paise': 55000,
+                             'days': closed_report['days']}
+    assert [day['billed_paise'] for day in closed_report['days']] == [10000, 20000, 30000]
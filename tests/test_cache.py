@@ -0,0 +1,27 @@
+import hospital_core
+
+
+def test_lookups_see_updates_from_other_connections(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    service.cache.recheck = 0
+    db.conn.execute("INSERT INTO doctors (doctor_id, name, specialization, fee_paise, phone) "
+                    "VALUES ('DOC001', 'Dr. Rao', 'Cardiology', 50000, '')")
+    db.conn.commit()
+    assert service.get_patient("P00000001") is None
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    assert service.get_patient(patient_id).name == "Ravi Kumar"
+    assert service.get_doctor("DOC001").fee_paise == 50000
+    hits = service.cache.hits
+    assert service.get_doctor("DOC001").fee_paise == 50000
+    assert service.cache.hits == hits + 1
+    
+    # Another desk (a second process) changes both rows
+    other = hospital_core.SimpleHospitalDB(db.path)
+    try:
+        other.conn.execute("UPDATE patients SET name = 'Ravi K.' WHERE patient_id = ?", (patient_id,))
+        other.conn.execute("UPDATE doctors SET fee_paise = 60000 WHERE doctor_id = 'DOC001'")
+        other.conn.commit()
+    finally:
+        other.close()
+    assert service.get_patient(patient_id).name == "Ravi K."
+    assert service.get_doctor("DOC001").fee_paise == 60000
@@ -0,0 +1,40 @@
+import datetime
+
+import hospital_core
+
+
+def test_changes_are_stamped_in_utc(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    entry = service.changes()['changes'][-1]
+    stamped = datetime.datetime.strptime(entry['changed_at'], "%Y-%m-%d %H:%M:%S.%f")
+    utc = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    assert abs(stamped - utc) < datetime.timedelta(minutes=1)
+
+
+def test_retention_cuts_by_utc_age(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    db.conn.execute("INSERT INTO change_log (table_name, op, row_id, data, changed_at) "
+                    "VALUES ('patients', 'update', 1, '{}', strftime('%Y-%m-%d %H:%M:%f', 'now', '-100 days'))")
+    db.conn.commit()
+    service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    result = service.compact_changes(keep_days=90, compact_days=None)
+    assert result['removed'] == 1
+    assert [entry['table'] for entry in service.changes(result['purged_through'])['changes']] == ['patients']
+
+
+def test_every_transaction_logs_its_actor(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db), actor="desk-1")
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    with service.acting_as("dr-rao"), service.transaction() as cursor:
+        cursor.execute("UPDATE patients SET address = 'Pune' WHERE patient_id = ?", (patient_id,))
+    db.conn.execute("UPDATE patients SET phone = '9000000000' WHERE patient_id = ?", (patient_id,))
+    db.conn.commit()
+    assert [entry['actor'] for entry in service.changes(tables=['patients'])['changes']] == ["desk-1", "dr-rao", None]
+
+
+def test_change_log_defaults_to_utc(db):
+    db.conn.execute("INSERT INTO change_log (table_name, op, row_id, data) VALUES ('patients', 'update', 1, '{}')")
+    stamped = db.conn.execute("SELECT changed_at FROM change_log ORDER BY seq DESC LIMIT 1").fetchone()[0]
+    utc = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    assert abs(datetime.datetime.strptime(stamped, "%Y-%m-%d %H:%M:%S.%f") - utc) < datetime.timedelta(minutes=1)
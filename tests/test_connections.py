@@ -0,0 +1,24 @@
+import threading
+
+import hospital_core
+
+
+def test_each_thread_gets_a_tuned_wal_connection(db):
+    seen = {}
+    
+    def desk():
+        conn = db.conn
+        seen['same'] = conn is db.conn
+        seen['conn'] = conn
+        seen['pragmas'] = {name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+                           for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store',
+                                        'busy_timeout')}
+    
+    thread = threading.Thread(target=desk)
+    thread.start()
+    thread.join()
+    assert seen['same'] and seen['conn'] is not db.conn
+    # synchronous NORMAL is 1, temp_store MEMORY is 2
+    assert seen['pragmas'] == {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -65536,
+                               'mmap_size': 268435456, 'temp_store': 2,
+                               'busy_timeout': hospital_core.BUSY_TIMEOUT_MS}
@@ -0,0 +1,44 @@
+import threading
+
+import hospital_core
+
+
+def test_sequence_continues_legacy_ids_in_their_width(db):
+    db.conn.executemany("INSERT INTO patients (patient_id, name) VALUES (?, ?)",
+                        [("P001", "Asha"), ("P002", "Ravi"), ("P010", "Meena")])
+    db.conn.execute("DELETE FROM patients WHERE patient_id = 'P002'")
+    db.conn.commit()
+    ids = hospital_core.IdAllocator(db)
+    assert [ids.next_id('P', 'patients') for _ in range(2)] == ["P011", "P012"]
+    assert ids.next_id('APT', 'appointments') == "APT00000001"
+
+
+def test_concurrent_allocators_never_repeat_an_id(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    got, errors = [], []
+    
+    def desk(block_size):
+        ids = hospital_core.IdAllocator(db, block_size)
+        try:
+            for _ in range(40):
+                if block_size == 1:
+                    with service.transaction(immediate=True):
+                        got.append(ids.next_id('P', 'patients'))
+                else:
+                    got.append(ids.next_id('P', 'patients'))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            ids.close()
+    
+    threads = [threading.Thread(target=desk, args=(block_size,)) for block_size in (1, 1, 7, 7, 25)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(got) == len(set(got)) == 200
+    assert all(len(patient_id) == 1 + hospital_core.ID_WIDTH for patient_id in got)
+    # Blocks are committed as whole ranges: the sequence ends past every number handed out
+    next_value = db.conn.execute("SELECT next_value FROM id_sequences WHERE name = 'patients'").fetchone()[0]
+    assert next_value > max(int(patient_id[1:]) for patient_id in got)
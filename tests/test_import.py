@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import hospital_core
+
+
+def _doctors_file(tmp_path, rows):
+    path = tmp_path / "doctors.jsonl"
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    return str(path)
+
+
+def _doctor(doctor_id, name="Dr. Rao"):
+    return {'doctor_id': doctor_id, 'name': name, 'specialization': 'Cardiology', 'fee': '500', 'phone': ''}
+
+
+def test_row_by_row_batch_commits_with_its_checkpoint(db, tmp_path, monkeypatch):
+    # DOC001 twice: the batch falls back to inserting row by row
+    path = _doctors_file(tmp_path, [_doctor('DOC001'), _doctor('DOC002'), _doctor('DOC001', 'Dr. Das')])
+    rejects = tmp_path / "rejects.jsonl"
+    importer = hospital_core.BulkImporter(db, hospital_core.IdAllocator(db), 'doctors', 10, str(rejects))
+    
+    def crash(*args):
+        raise OSError("disk full")
+    
+    monkeypatch.setattr(importer, '_save_checkpoint', crash)
+    with pytest.raises(OSError):
+        importer.run(path)
+    assert db.conn.execute("SELECT COUNT(*) FROM doctors").fetchone()[0] == 0
+    assert rejects.read_text() == ""
+    
+    monkeypatch.undo()
+    summary = importer.run(path)
+    assert (summary['inserted'], summary['rejected']) == (2, 1)
+    assert [json.loads(line)['row'] for line in rejects.read_text().splitlines()] == [3]
+
+
+def test_resume_drops_rejects_of_an_uncommitted_batch(db, tmp_path):
+    path = _doctors_file(tmp_path, [_doctor('DOC001'), {'name': ''}, _doctor('DOC002'), {'name': ''}])
+    rejects = tmp_path / "rejects.jsonl"
+    importer = hospital_core.BulkImporter(db, hospital_core.IdAllocator(db), 'doctors', 2, str(rejects))
+    importer.run(path)
+    first_batch = rejects.read_text().splitlines()[0]
+    # As if the process died after syncing the second batch's rejects but before its commit
+    db.conn.execute("UPDATE import_checkpoints SET rows_done = 2, inserted = 1, rejected = 1, finished = 0, "
+                    "rejects_offset = ?", (len(first_batch) + 1,))
+    db.conn.execute("DELETE FROM doctors WHERE doctor_id = 'DOC002'")
+    db.conn.commit()
+    
+    summary = importer.run(path)
+    assert (summary['resumed_from'], summary['inserted'], summary['rejected']) == (2, 2, 2)
+    assert [json.loads(line)['row'] for line in rejects.read_text().splitlines()] == [2, 4]
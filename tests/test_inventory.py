@@ -0,0 +1,29 @@
+import datetime
+
+import hospital_core
+
+
+def _day(offset):
+    return (datetime.date.today() + datetime.timedelta(days=offset)).isoformat()
+
+
+def test_dispense_takes_earliest_expiry_first_and_ledger_balances(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    late = service.add_medicine("Paracetamol", 10, 2, _day(90))
+    early = service.add_medicine("Paracetamol", 5, 2, _day(10))
+    allocations = service.dispense("Paracetamol", 8)
+    assert [(batch_id, units) for batch_id, units, _, _ in allocations] == [(early, 5), (late, 3)]
+    assert service.check_stock() == []
+
+
+def test_low_stock_leaves_out_expired_batches_without_writing(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    service.add_medicine("Amoxicillin", 50, 5, _day(60))
+    expired = service.add_medicine("Amoxicillin", 100, 5, _day(60))
+    service.set_reorder_level("Amoxicillin", 80)
+    db.conn.execute("UPDATE medicines SET expiry = ? WHERE id = ?", (_day(-1), expired))
+    db.conn.commit()
+    movements = db.conn.execute("SELECT COUNT(*) FROM stock_movements").fetchone()[0]
+    assert service.low_stock() == [("Amoxicillin", 50, 80)]
+    assert db.conn.execute("SELECT COUNT(*) FROM stock_movements").fetchone()[0] == movements
+    assert not db.conn.in_transaction
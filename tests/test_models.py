@@ -0,0 +1,30 @@
+import hospital_core
+
+
+def test_register_keeps_every_field(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    patient_id = service.register_patient("Ravi Kumar", 40, "m", "9123456789", "Main Road", reg_date="2024-05-01")
+    patient = service.get_patient(patient_id)
+    assert patient[1:] == (patient_id, "Ravi Kumar", 40, "M", "9123456789", "Main Road", "2024-05-01")
+
+
+def test_from_row_round_trip(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    row = db.conn.execute("SELECT * FROM patients WHERE patient_id = ?", (patient_id,)).fetchone()
+    patient = hospital_core.Patient.from_row(row)
+    assert tuple(patient) == row
+    assert patient.patient_id == patient_id and patient.name == "Ravi Kumar"
+    assert patient._replace(age=41).age == 41
+
+
+def test_patient_line_with_missing_fields():
+    patient = hospital_core.Patient.from_row((1, "P001", None, None, "", None, None, None))
+    assert hospital_core._patient_line(patient).startswith("ID: P001   | Name:                      | Age:   -")
+
+
+def test_fees_and_prices_are_exact_paise(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    assert hospital_core.Doctor.new("Dr. Rao", "Cardiology", "500.50").fee_paise == 50050
+    service.add_medicine("Paracetamol", 10, "0.10", "2099-01-01")
+    assert [medicine.price_paise for medicine in service.list_medicines()] == [10]
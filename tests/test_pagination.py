@@ -0,0 +1,20 @@
+import hospital_core
+
+
+def test_keyset_pages_cover_every_row_once(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    # Ties on every sort key, so pages must break them by id
+    dates = ["2024-01-01", "2024-01-01", "2024-01-02", "2024-01-01", "2024-01-03"] * 3
+    names = ["Ravi Kumar", "ravi kumar", "Rahul Das", "Ravi Kumar", "Meena Iyer"] * 3
+    registered = [service.register_patient(name, 30, "M", "9123456789", reg_date=date)
+                  for name, date in zip(names, dates)]
+    
+    for kwargs, expected in [({}, registered),
+                             ({'name_prefix': "RA"}, [p for p, name in zip(registered, names) if name[:2].lower() == "ra"]),
+                             ({'phone_prefix': "912"}, registered)]:
+        for page_size in (1, 2, 4, 100):
+            listed = [patient.patient_id for patient in service.iter_patients(page_size=page_size, **kwargs)]
+            assert sorted(listed) == sorted(expected), (kwargs, page_size)
+    
+    newest_first = [patient.reg_date for patient in service.iter_patients(page_size=2)]
+    assert newest_first == sorted(dates, reverse=True)
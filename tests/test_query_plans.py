@@ -0,0 +1,10 @@
+import hospital_core
+
+
+def test_hot_queries_use_indexes(db):
+    assert hospital_core.check_query_plans(db.conn) == []
+
+
+def test_table_scan_is_reported(db):
+    problems = hospital_core.check_query_plans(db.conn, {'by_address': "SELECT * FROM patients WHERE address = ?"})
+    assert problems == [('by_address', 'SCAN patients')]
@@ -0,0 +1,23 @@
+import io
+import os
+
+import pytest
+
+import hospital_core
+
+
+@pytest.mark.parametrize("blob_io", [True, False] if hospital_core.BLOB_IO else [False])
+def test_attachment_round_trip(db, monkeypatch, blob_io):
+    monkeypatch.setattr(hospital_core, 'BLOB_IO', blob_io)
+    monkeypatch.setattr(hospital_core, 'ATTACHMENT_CHUNK', 1000)
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    encounter_id = service.record_encounter(patient_id, "Chest X-ray")
+    data = os.urandom(4500)
+    first = service.attach(encounter_id, "scan.dcm", io.BytesIO(data))
+    second = service.attach(encounter_id, "copy.dcm", data)
+    chunks = []
+    assert service.read_attachment(second, chunks.append)['size'] == len(data)
+    assert b''.join(chunks) == data and max(map(len, chunks)) == 1000
+    assert service.attachment(first)['sha256'] == service.attachment(second)['sha256']
+    assert db.conn.execute("SELECT COUNT(*) FROM attachment_blobs").fetchone()[0] == 1
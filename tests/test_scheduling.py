@@ -0,0 +1,28 @@
+import datetime
+
+import pytest
+
+import hospital_core
+
+
+@pytest.fixture
+def service(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    db.conn.execute("INSERT INTO doctors (doctor_id, name, specialization, fee_paise, phone) "
+                    "VALUES ('DOC001', 'Dr. Rao', 'Cardiology', 50000, '')")
+    db.conn.commit()
+    return service
+
+
+def test_no_free_slots_in_the_past(service):
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    for date, time, _ in service.next_free_slots(from_date="2020-01-06", count=50):
+        assert f"{date} {time}" > now
+
+
+def test_booking_in_the_past_is_refused(service):
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    with pytest.raises(hospital_core.ValidationError):
+        service.book(patient_id, "DOC001", "2020-01-06", "10:00")
+    date, time, doctor_id = service.next_free_slots(count=1)[0]
+    assert service.book(patient_id, doctor_id, date, time)
@@ -0,0 +1,22 @@
+import pytest
+
+import hospital_core
+
+
+@pytest.mark.parametrize("typed, local", [
+    ("+91 91234 56789", "9123456789"),
+    ("0091 9123456789", "9123456789"),
+    ("919123456789", "9123456789"),
+    ("9123456789", "9123456789"),
+    ("91234", "91234"),
+    ("98765-43210", "9876543210"),
+])
+def test_local_phone(typed, local):
+    assert hospital_core.local_phone(typed) == local
+
+
+def test_search_by_phone_with_country_code(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    patient_id = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+    assert [p.patient_id for p in service.search_patients("+91 91234")] == [patient_id]
+    assert service.search_patients("+91") == []
@@ -0,0 +1,30 @@
+import pytest
+
+import hospital_core
+
+
+def _count(db, table):
+    return db.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_failed_transaction_leaves_nothing_behind(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    with pytest.raises(hospital_core.ValidationError):
+        with service.transaction():
+            service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+            service.register_patient("", 40, "M", "9123456789")
+    assert not db.conn.in_transaction
+    assert (_count(db, "patients"), _count(db, "change_log")) == (0, 0)
+    # The reserved number went back with the rollback
+    assert service.register_patient("Asha Rao", 35, "F", "9123456780") == hospital_core.format_id('P', 1)
+
+
+def test_inner_failure_only_undoes_its_own_writes(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    with service.transaction():
+        kept = service.register_patient("Ravi Kumar", 40, "M", "9123456789")
+        with pytest.raises(hospital_core.ValidationError):
+            with service.transaction():
+                service.register_patient("Asha Rao", 35, "F", "9123456780")
+                service.register_patient("Meena Iyer", 200, "F", "9123456781")
+    assert [patient.patient_id for patient in service.iter_patients()] == [kept]
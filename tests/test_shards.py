@@ -0,0 +1,107 @@
+import datetime
+
+import pytest
+
+import hospital_core
+
+
+@pytest.fixture
+def shards(tmp_path):
+    paths = {code: str(tmp_path / f"{code.lower()}.db") for code in ("HYD", "BLR")}
+    for path in paths.values():
+        hospital_core.SimpleHospitalDB(path).close()
+    yield paths
+    for path in list(hospital_core._report_services):
+        if path in paths.values():
+            service = hospital_core._report_services.pop(path)
+            service.ids.close()
+            service.db.close()
+
+
+def add_bill(path, bill_no, day, total_paise, paid_paise):
+    db = hospital_core.SimpleHospitalDB(path)
+    db.conn.execute("INSERT INTO bills (bill_no, patient_id, status, created_at, total_paise, paid_paise) "
+                    "VALUES (?, 'P00000001', 'Pending', ?, ?, ?)",
+                    (bill_no, f"{day} 10:00:00", total_paise, paid_paise))
+    db.conn.commit()
+    db.close()
+
+
+@pytest.mark.parametrize("value, split", [
+    ("HYD-P00000001", ("HYD", "P00000001")),
+    ("hyd-P00000001", ("HYD", "P00000001")),
+    ("P00000001", (None, "P00000001")),
+    ("X-P00000001", (None, "X-P00000001")),
+])
+def test_split_branch_id(value, split):
+    assert hospital_core.split_branch_id(value) == split
+
+
+def test_route_by_id_and_default_branch(shards):
+    router = hospital_core.ShardRouter(shards, default_branch="HYD")
+    assert router.route({'patient_id': "BLR-P00000007"}) == ("BLR", {'patient_id': "P00000007"})
+    assert router.route({'patient_id': "P00000007"}) == ("HYD", {'patient_id': "P00000007"})
+    assert router.route({'name': "Ravi"}, branch="blr") == ("BLR", {'name': "Ravi"})
+    router.close()
+
+
+def test_ids_of_two_branches_are_refused(shards):
+    router = hospital_core.ShardRouter(shards)
+    with pytest.raises(hospital_core.ValidationError):
+        router.route({'patient_id': "HYD-P00000001", 'doctor_id': "BLR-DOC001"})
+    with pytest.raises(hospital_core.ValidationError):
+        router.route({'patient_id': "HYD-P00000001"}, branch="BLR")
+    with pytest.raises(hospital_core.ValidationError):
+        router.route({'patient_id': "P00000001"})
+    router.close()
+
+
+def test_new_ids_carry_the_branch(shards):
+    router = hospital_core.ShardRouter(shards)
+    patient_id = router.call('register_patient', branch="BLR", name="Ravi Kumar", age=40, gender="M",
+                             phone="9123456789")
+    assert hospital_core.split_branch_id(patient_id)[0] == "BLR"
+    assert router.call('get_patient', patient_id=patient_id).name == "Ravi Kumar"
+    router.close()
+
+
+def test_merge_reports_sums_counts_and_rows():
+    merged = hospital_core.merge_reports([
+        {'date': "2026-03-01", 'bills': 2, 'billed_paise': 500, 'nested': {'count': 1},
+         'days': [{'date': "2026-03-01", 'bills': 2}]},
+        {'date': "2026-03-01", 'bills': 3, 'billed_paise': None, 'nested': {'count': 4},
+         'days': [{'date': "2026-03-01", 'bills': 1}, {'date': "2026-03-02", 'bills': 5}]},
+    ])
+    assert merged == {'date': "2026-03-01", 'bills': 5, 'billed_paise': 500, 'nested': {'count': 5},
+                      'days': [{'date': "2026-03-01", 'bills': 3}, {'date': "2026-03-02", 'bills': 5}]}
+    assert hospital_core.merge_reports([{'period': 'mtd'}, {'period': 'ytd'}]) == {'period': None}
+
+
+def test_period_report_recomputes_the_percentage(shards):
+    day = datetime.date.today().replace(day=1)
+    last_year = hospital_core._year_earlier(day)
+    add_bill(shards['HYD'], "B1", day, 30_000, 0)
+    add_bill(shards['HYD'], "B2", last_year, 10_000, 0)
+    add_bill(shards['BLR'], "B3", day, 10_000, 0)
+    add_bill(shards['BLR'], "B4", last_year, 30_000, 0)
+    reports = hospital_core.FederatedReports(shards, processes=1)
+    result = reports.period_report('mtd', day)
+    reports.close()
+    assert result['branches']['HYD']['billed_change_pct'] == 200.0
+    assert result['branches']['BLR']['billed_change_pct'] == -66.7
+    # Not 200 + -66.7: 40,000 against 40,000 a year earlier
+    assert result['total']['billed_change_pct'] == 0.0
+
+
+def test_sequential_and_pooled_reports_agree(shards):
+    today = datetime.date.today()
+    add_bill(shards['HYD'], "B1", today, 25_000, 5_000)
+    add_bill(shards['BLR'], "B2", today, 40_000, 40_000)
+    add_bill(shards['BLR'], "B3", today - datetime.timedelta(days=1), 1_000, 0)
+    results = []
+    for processes in (1, 2):
+        reports = hospital_core.FederatedReports(shards, processes=processes)
+        results.append(reports.financial_report(today - datetime.timedelta(days=1), today, by_day=True))
+        reports.close()
+    assert results[0] == results[1]
+    assert results[0]['total']['billed_paise'] == 66_000
@@ -0,0 +1,29 @@
+import datetime
+
+import hospital_core
+
+
+def test_counters_follow_inserts_updates_and_deletes(db):
+    service = hospital_core.HospitalService(db, hospital_core.IdAllocator(db))
+    today = datetime.date.today().isoformat()
+    db.conn.executemany("INSERT INTO doctors (doctor_id, name, specialization, fee_paise, phone, available) "
+                        "VALUES (?, ?, 'Cardiology', 50000, '', ?)", [("DOC001", "Dr. Rao", 1), ("DOC002", "Dr. Das", 0)])
+    db.conn.commit()
+    patients = [service.register_patient(f"Patient {i}", 30, "F", "9123456789") for i in range(4)]
+    for n, patient_id in enumerate(patients[:3]):
+        db.conn.execute("INSERT INTO appointments (appointment_id, patient_id, doctor_id, date, time, status) "
+                        "VALUES (?, ?, 'DOC001', ?, ?, 'Completed')", (f"APT{n}", patient_id, today, f"1{n}:00"))
+    db.conn.commit()
+    service.add_medicine("Paracetamol", 40, 5, "2099-01-01")
+    service.dispense("Paracetamol", 15, patient_id=patients[0])
+    bill_no = service.create_bill(patients[0])
+    assert service.statistics() == service.statistics(exact=True)
+    
+    db.conn.execute("DELETE FROM patients WHERE patient_id = ?", (patients[3],))
+    db.conn.execute("DELETE FROM appointments WHERE appointment_id = 'APT1'")
+    db.conn.execute("UPDATE doctors SET available = 1 WHERE doctor_id = 'DOC002'")
+    db.conn.commit()
+    service.record_payment(bill_no, 500)
+    assert service.statistics() == service.statistics(exact=True) == {
+        'patients': 3, 'available_doctors': 2, 'appointments_today': 2, 'medicine_units': 25, 'pending_bills': 1}
+    assert service.check_counters() == {}